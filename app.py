@@ -1,10 +1,17 @@
-from flask import Flask, request, jsonify, send_file, render_template, make_response
+from flask import Flask, request, jsonify, send_file, send_from_directory, render_template, make_response, Response, stream_with_context
 from poem_generator import PoemGenerator
 from pdf_generator import PoemPDFGenerator
+from pdf_cache import create_pdf_cache
+from pdf_batch import stream_batch
+from version_store import VersionStore
+from job_queue import JobQueue
+from rijm_checker import find_rhymes, check_scheme
+from storage import ON_VERCEL, storage_path
 import os
 import datetime
 import re
 import json
+import threading
 from werkzeug.middleware.proxy_fix import ProxyFix
 import io
 
@@ -13,48 +20,84 @@ app.wsgi_app = ProxyFix(app.wsgi_app)
 generator = PoemGenerator()
 pdf_generator = PoemPDFGenerator()
 
-# For Vercel deployment - use /tmp for file storage
-STORAGE_DIR = '/tmp' if os.environ.get('VERCEL') else os.path.dirname(__file__)
-
-# Update paths to use STORAGE_DIR
-VERSION_FILE = os.path.join(STORAGE_DIR, 'poem_versions.json')
-POEMS_DIR = os.path.join(STORAGE_DIR, 'poems')
-PDFS_DIR = os.path.join(STORAGE_DIR, 'pdfs')
-PREVIEWS_DIR = os.path.join(STORAGE_DIR, 'previews')
-FONTS_DIR = os.path.join(STORAGE_DIR, 'fonts')
+# Files are stored under STORAGE_DIR, /tmp on Vercel
+VERSION_FILE = storage_path('poem_versions.json')
+VERSION_DB = storage_path('poem_versions.sqlite3')
+POEMS_DIR = storage_path('poems')
+PDFS_DIR = storage_path('pdfs')
+PREVIEWS_DIR = storage_path('previews')
+FONTS_DIR = storage_path('fonts')
+# Most rhymes /get_rhyming_words returns in one answer
+MAX_RHYME_LIMIT = 200
 
 # Create necessary directories
 for directory in [POEMS_DIR, PDFS_DIR, PREVIEWS_DIR, FONTS_DIR]:
     os.makedirs(directory, exist_ok=True)
 
-# Dictionary to store version numbers
+# Rendered previews and downloads, keyed on their content
+pdf_cache = create_pdf_cache(os.path.join(PREVIEWS_DIR, 'cache'))
 
-def load_versions():
-    """Load version numbers from file"""
-    if os.path.exists(VERSION_FILE):
-        try:
-            with open(VERSION_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-def save_versions(versions):
-    """Save version numbers to file"""
-    try:
-        with open(VERSION_FILE, 'w') as f:
-            json.dump(versions, f)
-    except:
-        pass  # Fail silently on Vercel due to read-only filesystem
+def cached_pdf_response(lines, formatting, disposition):
+    """PDF response from the render cache, or 304 if the client already has it"""
+    etag = pdf_generator.render_key(lines, formatting)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        pdf_bytes = pdf_cache.get_or_compute(etag, lambda: pdf_generator.generate_pdf_bytes(lines, formatting))
+        response = make_response(pdf_bytes)
+        response.headers['Content-Type'] = 'application/pdf'
+        response.headers['Content-Disposition'] = disposition
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Version numbers per name, shared by all workers
+version_store = VersionStore(VERSION_DB, legacy_json_path=VERSION_FILE)
 
 def get_next_version(name):
     """Get next version number for a given name"""
-    versions = load_versions()
-    current_version = versions.get(name, 0)
-    next_version = current_version + 1
-    versions[name] = next_version
-    save_versions(versions)
-    return next_version
+    return version_store.next_version(name)
+
+# PDF's of saved poems are rendered in the background
+# On Vercel there are no background threads between requests, jobs run inline there
+job_queue = JobQueue(storage_path('jobs.sqlite3'),
+                     workers=int(os.environ.get('RIJM_JOB_WORKERS', 1)),
+                     inline=os.environ.get('RIJM_JOB_INLINE', '1' if ON_VERCEL else '0') == '1')
+
+def render_saved_pdf(payload):
+    """Render the PDF of a saved poem, runs on the job queue"""
+    pdf_filepath = os.path.join(PDFS_DIR, payload['pdf_filename'])
+    pdf_generator.generate_pdf(payload['lines'], payload['formatting'], pdf_filepath)
+    return {'pdf_path': payload['pdf_filename']}
+
+job_queue.register('render_pdf', render_saved_pdf)
+
+background_started = False
+background_lock = threading.Lock()
+
+def start_background_work():
+    """Warm up the poem corpus and fonts and start the job workers, once
+    per process. Not done at import: the worker processes of pdf_batch
+    import this module too."""
+    global background_started
+    with background_lock:
+        if background_started:
+            return
+        background_started = True
+    if os.environ.get('RIJM_WARM_UP', '1') != '0':
+        generator.sint_scraper.loader.warm_up()
+        generator.poem_index.warm_up()
+        pdf_generator.fonts.warm_up()
+    if job_queue.workers > 0:
+        # Also picks up jobs left behind by a restart
+        job_queue.start()
+
+@app.before_request
+def ensure_background_work():
+    """Start the background work on the first request, for servers that
+    import the app without a startup hook (gunicorn, Vercel)"""
+    if not background_started:
+        start_background_work()
 
 def sanitize_filename(filename):
     """Remove invalid characters from filename"""
@@ -89,6 +132,50 @@ def generate_poem():
             'error': str(e)
         })
 
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    """Genereer gedichten voor een hele groep in zo min mogelijk AI-aanroepen"""
+    try:
+        data = request.get_json()
+        defaults = data.get('defaults', {})
+        recipients = [{**defaults, **recipient} for recipient in data.get('recipients', [])]
+        if not recipients:
+            return jsonify({
+                'success': False,
+                'error': 'Geen personen opgegeven'
+            })
+        
+        poems = generator.generate_poems(recipients)
+        return jsonify({
+            'success': True,
+            'poems': [{'name': recipient.get('name', ''), 'poem': poem}
+                      for recipient, poem in zip(recipients, poems)]
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/generate_stream', methods=['POST'])
+def generate_poem_stream():
+    """Stream het gedicht als server-sent events, één event per regel"""
+    data = request.get_json()
+    
+    def events():
+        try:
+            for line in generator.generate_poem_stream(data):
+                yield f"data: {json.dumps({'line': line})}\n\n"
+            yield f"data: {json.dumps({'done': True})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/regenerate_line', methods=['POST'])
 def regenerate_line():
     """Endpoint voor het regenereren van een enkele regel"""
@@ -163,9 +250,56 @@ def get_alternative_words():
 
 @app.route('/get_rhyming_words', methods=['POST'])
 def get_rhymes():
-    word = request.json.get('word', '')
-    rhyming_words = get_rhyming_words(word)
-    return jsonify({'rhyming_words': rhyming_words})
+    try:
+        data = request.get_json(silent=True) or {}
+        word = data.get('word', '')
+        limit = data.get('limit', 20)
+        min_strength = data.get('min_strength', 1.0)
+        if not isinstance(word, str):
+            return jsonify({'success': False, 'error': 'Het woord moet tekst zijn'}), 400
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 0 <= limit <= MAX_RHYME_LIMIT:
+            return jsonify({
+                'success': False,
+                'error': f'limit moet een geheel getal van 0 tot en met {MAX_RHYME_LIMIT} zijn'
+            }), 400
+        if not isinstance(min_strength, (int, float)) or isinstance(min_strength, bool) or \
+                not 0.0 <= min_strength <= 1.0:
+            return jsonify({'success': False, 'error': 'min_strength moet een getal van 0 tot en met 1 zijn'}), 400
+
+        rhymes = find_rhymes(word, limit=limit, min_strength=float(min_strength))
+        return jsonify({
+            'rhyming_words': [rhyme.word for rhyme in rhymes],
+            'rhymes': [rhyme._asdict() for rhyme in rhymes]
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/check_rhyme_scheme', methods=['POST'])
+def check_rhyme_scheme():
+    """Controleer het rijmschema van een heel gedicht in één aanroep"""
+    try:
+        data = request.get_json()
+        lines = data.get('lines', [])
+        scheme = data.get('scheme', 'aabb')
+        
+        if not lines:
+            return jsonify({
+                'success': False,
+                'error': 'Geen gedichtregels meegegeven'
+            })
+        
+        pairs = check_scheme(lines, scheme)
+        return jsonify({
+            'success': True,
+            'pairs': pairs,
+            'all_rhyme': all(pair['rhymes'] for pair in pairs)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
 
 @app.route('/get_rhyming_words_v2', methods=['POST'])
 def get_rhyming_words_v2():
@@ -211,15 +345,47 @@ def save_poem():
         with open(txt_filepath, 'w', encoding='utf-8') as f:
             f.write('\n'.join(lines))
         
-        # Generate PDF version
-        pdf_filepath = os.path.join(PDFS_DIR, f'{filename}.pdf')
-        pdf_generator.generate_pdf(lines, formatting, pdf_filepath)
+        # Render the PDF version in the background
+        job_id = job_queue.enqueue('render_pdf', {
+            'lines': lines,
+            'formatting': formatting,
+            'pdf_filename': f'{filename}.pdf'
+        })
         
         return jsonify({
             'success': True,
             'txt_filename': f'{filename}.txt',
-            'pdf_path': f'{filename}.pdf'
+            'pdf_path': f'{filename}.pdf',
+            'job_id': job_id,
+            'status_url': f'/save_status/{job_id}'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
         })
+
+@app.route('/save_status/<job_id>', methods=['GET'])
+def save_status(job_id):
+    """Status of the PDF of a saved poem, with a link once it is ready"""
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({
+                'success': False,
+                'error': 'Onbekende taak'
+            }), 404
+        
+        response = {
+            'success': True,
+            'status': job['status']
+        }
+        if job['status'] == 'done':
+            response['pdf_url'] = f"/saved_pdf/{job['result']['pdf_path']}"
+        elif job['status'] == 'failed':
+            response['error'] = job['error']
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({
@@ -227,6 +393,11 @@ def save_poem():
             'error': str(e)
         })
 
+@app.route('/saved_pdf/<filename>')
+def get_saved_pdf(filename):
+    """Serve the rendered PDF of a saved poem"""
+    return send_from_directory(PDFS_DIR, filename, mimetype='application/pdf', as_attachment=True)
+
 @app.route('/download_pdf', methods=['POST'])
 def download_pdf():
     """Download the PDF version of the poem"""
@@ -241,14 +412,8 @@ def download_pdf():
                 'error': 'Geen gedichtregels meegegeven'
             })
         
-        # Generate PDF in memory
-        pdf_bytes = pdf_generator.generate_pdf_bytes(lines, formatting)
-        
-        # Return the PDF file directly
-        response = make_response(pdf_bytes)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = 'attachment; filename=sinterklaasgedicht.pdf'
-        return response
+        # Return the PDF directly, rendered only if it is not cached yet
+        return cached_pdf_response(lines, formatting, 'attachment; filename=sinterklaasgedicht.pdf')
         
     except Exception as e:
         return jsonify({
@@ -270,13 +435,50 @@ def preview_pdf():
                 'error': 'Geen gedichtregels meegegeven'
             })
         
-        # Generate PDF in memory
-        pdf_bytes = pdf_generator.generate_pdf_bytes(lines, formatting)
+        # Return the PDF directly, rendered only if it is not cached yet
+        return cached_pdf_response(lines, formatting, 'inline')
         
-        # Return the PDF file directly
-        response = make_response(pdf_bytes)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = 'inline'
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/batch_pdf', methods=['POST'])
+def batch_pdf():
+    """Render PDF's for a whole group at once, as ZIP or as one PDF"""
+    try:
+        data = request.get_json()
+        output_format = data.get('format', 'zip')
+        default_formatting = data.get('formatting', {})
+        
+        poems = []
+        filenames = set()
+        for poem in data.get('poems', []):
+            lines = poem.get('lines', [])
+            if not lines:
+                continue
+            # Unique filename per person within the ZIP
+            base = sanitize_filename(poem.get('name', '').strip()) or 'Gedicht'
+            filename = f'{base}_Gedicht.pdf'
+            n = 1
+            while filename in filenames:
+                n += 1
+                filename = f'{base}_Gedicht_{n}.pdf'
+            filenames.add(filename)
+            poems.append({
+                'filename': filename,
+                'lines': lines,
+                'formatting': {**default_formatting, **poem.get('formatting', {})}
+            })
+        
+        chunks, mimetype = stream_batch(pdf_generator, poems, output_format)
+        
+        # Stream the export as it is rendered instead of building it in memory
+        extension = 'pdf' if output_format == 'pdf' else 'zip'
+        response = Response(stream_with_context(chunks), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename=sinterklaasgedichten.{extension}'
+        response.headers['X-Accel-Buffering'] = 'no'
         return response
         
     except Exception as e:
@@ -300,6 +502,33 @@ def get_fonts():
             'error': str(e)
         })
 
+@app.route('/health', methods=['GET'])
+def health():
+    """Readiness of the lazily loaded resources"""
+    resources = {
+        'poems': generator.sint_scraper.loader,
+        'examples': generator.poem_index,
+        'fonts': pdf_generator.fonts
+    }
+    return jsonify({
+        'ready': all(resource.ready for resource in resources.values()),
+        'resources': {name: resource.status() for name, resource in resources.items()},
+        'jobs': job_queue.stats()
+    })
+
+@app.route('/pdf_cache_status', methods=['GET'])
+def pdf_cache_status():
+    """Tellers van de PDF cache"""
+    return jsonify(pdf_cache.stats())
+
+@app.route('/llm_status', methods=['GET'])
+def llm_status():
+    """Tellers van de AI-cache en samengevoegde verzoeken, en de stand van de circuit breaker"""
+    return jsonify({
+        'success': True,
+        'stats': generator.llm_stats()
+    })
+
 @app.route('/preview/<filename>')
 def get_preview(filename):
     """Serve preview PDF file"""
@@ -316,5 +545,6 @@ def get_preview(filename):
         })
 
 if __name__ == '__main__':
+    start_background_work()
     app.debug = False
     app.run(port=5001)
@@ -0,0 +1,103 @@
+"""
+ASGI entry point
+
+The LLM-backed endpoints are served natively async here, so a single
+worker can keep hundreds of OpenAI requests in flight instead of one per
+sync worker. All other routes are handed to the Flask app.
+
+Run with:
+
+    uvicorn asgi:application --workers 2
+"""
+import json
+from asgiref.wsgi import WsgiToAsgi
+from app import app, generator, start_background_work
+
+flask_application = WsgiToAsgi(app)
+
+async def read_json(receive):
+    """Read the complete request body and parse it as JSON"""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return json.loads(body or b'{}')
+
+async def send_json(send, payload, status=200):
+    """Send a JSON response"""
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def generate_poem(data):
+    poem = await generator.generate_poem_async(data)
+    if not poem:
+        return {'success': False, 'error': 'Kon geen gedicht genereren'}
+    return {'success': True, 'poem': poem}
+
+async def regenerate_line(data):
+    context = data.get('context', {})
+    if not context:
+        return {'success': False, 'error': 'Geen context meegegeven'}
+    new_line = await generator.generate_single_line_async(
+        previous_line=data.get('previousLine', ''),
+        context=context,
+        target_words=data.get('targetWords')
+    )
+    return {'success': True, 'new_line': new_line}
+
+async def get_alternative_words(data):
+    word = data.get('word', '')
+    context = data.get('context', '')
+    if not word or not context:
+        return {'success': False, 'error': 'Geen woord of context meegegeven'}
+    alternatives = await generator.get_alternative_words_async(word, context)
+    return {'success': True, 'alternatives': alternatives}
+
+async def get_rhyming_words_v2(data):
+    rhyming_words = await generator.suggest_rhyming_words_async(data.get('word'))
+    return {'rhyming_words': rhyming_words}
+
+# Same paths and response format as the Flask routes
+ASYNC_ROUTES = {
+    '/generate': generate_poem,
+    '/regenerate_line': regenerate_line,
+    '/get_alternative_words': get_alternative_words,
+    '/get_rhyming_words_v2': get_rhyming_words_v2,
+}
+
+async def lifespan(receive, send):
+    """Start the background work when the server starts"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_background_work()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    handler = ASYNC_ROUTES.get(scope.get('path'))
+    if scope['type'] != 'http' or scope.get('method') != 'POST' or handler is None:
+        await flask_application(scope, receive, send)
+        return
+
+    start_background_work()
+    try:
+        payload = await handler(await read_json(receive))
+    except Exception as e:
+        payload = {'success': False, 'error': str(e)}
+    await send_json(send, payload)
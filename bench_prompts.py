@@ -0,0 +1,168 @@
+"""
+Benchmark of the prompt variants against the original prompt code
+
+The baseline is a copy of how PoemGenerator built its messages before the
+prompts were precompiled: the style guide and theme tables are rebuilt
+and the indented f-strings are rendered on every request, so the
+indentation is sent to the API as well.
+
+Token counts are estimates (rate_limiter.estimate_tokens, about four
+characters per token); the exact counts per request are reported by the
+API and shown in /llm_status.
+
+    python bench_prompts.py -n 20000
+"""
+import argparse
+import time
+from prompts import system_prompt, user_prompt
+from rate_limiter import estimate_tokens
+
+CONTEXT = {'name': 'Tim', 'gender': 'jongen', 'gift': 'een nieuwe fiets', 'hobbies': 'voetballen, gamen',
+           'is_surprise': True, 'theme': 'sinterklaas', 'difficulty': 'medium'}
+
+def baseline_system_message(theme, difficulty):
+    """The original poem_system_message"""
+    # Bepaal de stijl op basis van moeilijkheidsgraad
+    style_guide = {
+        'easy': (
+            "- Gebruik eenvoudige woorden en korte zinnen\n"
+            "- Vermijd moeilijke constructies\n"
+            "- Maak het speels en vrolijk\n"
+            "- Gebruik veel concrete voorbeelden\n"
+            "- Houd het tempo vlot"
+        ),
+        'medium': (
+            "- Gebruik gevarieerd taalgebruik\n"
+            "- Mix eenvoudige en complexere zinnen\n"
+            "- Voeg wat woordgrapjes toe\n"
+            "- Gebruik beeldspraak waar passend\n"
+            "- Zorg voor een goede afwisseling"
+        ),
+        'hard': (
+            "- Gebruik rijke taal en complexere zinstructuren\n"
+            "- Voeg subtiele humor en woordspelingen toe\n"
+            "- Gebruik creatieve beeldspraak\n"
+            "- Maak verrassende verbanden\n"
+            "- Voeg diepere lagen toe aan het gedicht"
+        )
+    }[difficulty]
+
+    # Bepaal thema-specifieke elementen
+    theme_elements = {
+        'sinterklaas': (
+            "- Verwijs naar Sinterklaas en zijn Pieten\n"
+            "- Gebruik traditionele Sinterklaas-elementen\n"
+            "- Verwijs naar pakjesavond en surprises"
+        ),
+        'verjaardag': (
+            "- Focus op de feestelijke gelegenheid\n"
+            "- Verwijs naar leeftijd en groei\n"
+            "- Gebruik vrolijke, feestelijke taal"
+        ),
+        'afscheid': (
+            "- Toon waardering voor de persoon\n"
+            "- Verwijs naar gedeelde herinneringen\n"
+            "- Eindig met goede wensen voor de toekomst"
+        ),
+        'bedankt': (
+            "- Uit oprechte dankbaarheid\n"
+            "- Verwijs naar specifieke acties of momenten\n"
+            "- Maak het persoonlijk en warm"
+        )
+    }[theme]
+
+    system_message = {
+        "role": "system",
+        "content": f"""Je bent een Nederlandse dichter, gespecialiseerd in het schrijven van {theme}-gedichten.
+            Gebruik ALLEEN natuurlijk, idiomatisch Nederlands - geen vertalingen uit het Engels.
+            
+            Stijlniveau voor dit gedicht:
+            {style_guide}
+            
+            Thema-specifieke elementen:
+            {theme_elements}
+            
+            Belangrijke taalrichtlijnen:
+            - Gebruik Nederlandse zinsconstructies (NIET: 'Hij is aan het spelen games' maar 'Hij speelt graag spelletjes')
+            - Gebruik typisch Nederlandse uitdrukkingen en gezegden
+            - Vermijd letterlijke vertalingen uit het Engels
+            - Let op correcte werkwoordvolgorde in bijzinnen
+            - Gebruik natuurlijke Nederlandse woordvolgorde
+            
+            Stijlrichtlijnen:
+            - Maak het persoonlijk en origineel
+            - Gebruik humor die past bij het thema en niveau
+            - Vermijd clichés
+            - Zorg voor een originele, pakkende opening die past bij de context
+            - Gebruik rijm (bij voorkeur gepaard rijm: aabb)"""
+    }
+    return system_message
+
+def baseline_messages(context, couplets=()):
+    """The original poem_messages"""
+    is_child = context['gender'] in ['jongen', 'meisje']
+    theme = context.get('theme', 'sinterklaas')
+    difficulty = context.get('difficulty', 'medium')
+    system_message = baseline_system_message(theme, difficulty)
+
+    # Passende voorbeelden uit het corpus, als inspiratie voor toon en rijm
+    examples = ''
+    if couplets:
+        examples = "\nVoorbeelden van de gewenste toon (niet overnemen):\n" + \
+            "\n\n".join(couplets) + "\n"
+
+    user_message = {
+        "role": "user",
+        "content": f"""Schrijf een origineel {theme}-gedicht in natuurlijk Nederlands voor deze persoon:
+            
+            Persoon:
+            - Naam: {context['name']}
+            - {'Kind' if is_child else 'Volwassene'}: {context['gender']}
+            - Cadeau: {context['gift']}
+            - Hobby's: {context['hobbies']}
+            - Surprise: {'ja' if context['is_surprise'] else 'nee'}
+            
+            Het gedicht moet:
+            - Persoonlijk zijn en de context gebruiken
+            - 6-8 regels lang zijn
+            - Rijmen (aabb)
+            - Natuurlijk Nederlands gebruiken
+            - Een verrassende opening hebben
+            - Humor bevatten die past bij een {'kind' if is_child else 'volwassene'}
+            - Passen bij het gekozen thema: {theme}
+            - Qua moeilijkheid passen bij niveau: {difficulty}
+            {examples}
+            Begin direct met het gedicht, zonder inleiding."""
+    }
+
+    return [system_message, user_message]
+
+def precompiled_messages(context, variant):
+    """How PoemGenerator.poem_messages builds them now"""
+    return [
+        {"role": "system", "content": system_prompt(context['theme'], context['difficulty'], variant)},
+        {"role": "user", "content": user_prompt(context, variant=variant)}
+    ]
+
+def benchmark(repeat=20000):
+    cases = [
+        ('origineel', lambda: baseline_messages(CONTEXT)),
+        ('voorgecompileerd, volledig', lambda: precompiled_messages(CONTEXT, 'full')),
+        ('voorgecompileerd, compact', lambda: precompiled_messages(CONTEXT, 'compact'))
+    ]
+    print("Invoertokens zijn geschat (ongeveer 4 tekens per token)")
+    for name, build in cases:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            messages = build()
+        micros = (time.perf_counter() - start) / repeat * 1e6
+        print(f"{name:30} {micros:6.2f} µs per aanvraag, ~{estimate_tokens(messages, 0):4d} invoertokens")
+
+def main():
+    parser = argparse.ArgumentParser(description="Vergelijk de promptvarianten met de oorspronkelijke prompts")
+    parser.add_argument('-n', '--repeat', type=int, default=20000, help="Aantal herhalingen")
+    args = parser.parse_args()
+    benchmark(args.repeat)
+
+if __name__ == '__main__':
+    main()
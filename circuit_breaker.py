@@ -0,0 +1,140 @@
+"""
+Process-wide circuit breaker for the OpenAI API
+
+The breaker watches the outcome and duration of recent API calls. When
+too many of them fail, or too many are slow, it opens: calls are refused
+at once and the generator answers from its local fallbacks instead of
+retrying against an API that is down. After a cool-down it lets a single
+trial call through (half-open); if that succeeds it closes again,
+otherwise it stays open for another cool-down.
+"""
+from collections import deque
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Number of recent calls the rates are computed over
+WINDOW = int(os.environ.get('OPENAI_BREAKER_WINDOW', 20))
+# Calls needed in the window before the breaker may open
+MIN_CALLS = int(os.environ.get('OPENAI_BREAKER_MIN_CALLS', 5))
+FAILURE_RATE = float(os.environ.get('OPENAI_BREAKER_FAILURE_RATE', 0.5))
+SLOW_CALL_SECONDS = float(os.environ.get('OPENAI_BREAKER_SLOW_SECONDS', 20))
+SLOW_CALL_RATE = float(os.environ.get('OPENAI_BREAKER_SLOW_RATE', 0.8))
+OPEN_SECONDS = float(os.environ.get('OPENAI_BREAKER_OPEN_SECONDS', 30))
+
+class CircuitOpen(Exception):
+    """Raised when a call is refused because the breaker is open"""
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker on failure rate and slow-call rate"""
+
+    def __init__(self, name, window=WINDOW, min_calls=MIN_CALLS, failure_rate=FAILURE_RATE,
+                 slow_call_seconds=SLOW_CALL_SECONDS, slow_call_rate=SLOW_CALL_RATE,
+                 open_seconds=OPEN_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.clock = clock
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.calls = deque(maxlen=window)  # (failed, slow) per call
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.rejected = 0
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    def available(self):
+        """Whether a call would be let through now, without starting one"""
+        with self.lock:
+            if self.state == OPEN:
+                return self.clock() >= self.opened_at + self.open_seconds
+            return not (self.state == HALF_OPEN and self.trial_running)
+
+    def allow(self):
+        """Start a call, or raise CircuitOpen. Every allowed call must be
+        followed by record()."""
+        with self.lock:
+            if self.state == OPEN and self.clock() >= self.opened_at + self.open_seconds:
+                self.state = HALF_OPEN
+                self.trial_running = False
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return
+            self.rejected += 1
+        raise CircuitOpen(f"De AI is tijdelijk niet beschikbaar ({self.name})")
+
+    def record(self, failed, seconds):
+        """Record the outcome of an allowed call"""
+        slow = seconds >= self.slow_call_seconds
+        with self.lock:
+            if self.state == OPEN:
+                # A call that started before the breaker opened
+                return
+            if self.state == HALF_OPEN:
+                self.trial_running = False
+                if failed or slow:
+                    self.trip()
+                else:
+                    self.state = CLOSED
+                    self.calls.clear()
+                return
+            self.calls.append((failed, slow))
+            if self.state == CLOSED and len(self.calls) >= self.min_calls:
+                failures = sum(1 for failed, _ in self.calls if failed)
+                slow_calls = sum(1 for _, slow in self.calls if slow)
+                if failures / len(self.calls) >= self.failure_rate or \
+                        slow_calls / len(self.calls) >= self.slow_call_rate:
+                    self.trip()
+
+    @contextmanager
+    def call(self, ignore=()):
+        """Guard one call: raises CircuitOpen when refused, records the
+        outcome otherwise. Exceptions in `ignore` do not count as failures."""
+        self.allow()
+        started = self.clock()
+        failed = True
+        try:
+            yield
+            failed = False
+        except ignore:
+            failed = False
+            raise
+        finally:
+            self.record(failed, self.clock() - started)
+
+    def trip(self):
+        """Open the breaker, the lock must be held"""
+        if self.state != OPEN:
+            self.times_opened += 1
+            print(f"Circuit breaker {self.name} open voor {self.open_seconds:.0f} seconden")
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.calls.clear()
+
+    def status(self):
+        with self.lock:
+            calls = len(self.calls)
+            status = {
+                'state': self.state,
+                'calls': calls,
+                'failure_rate': round(sum(1 for failed, _ in self.calls if failed) / calls, 2) if calls else 0.0,
+                'slow_rate': round(sum(1 for _, slow in self.calls if slow) / calls, 2) if calls else 0.0,
+                'rejected': self.rejected,
+                'times_opened': self.times_opened
+            }
+            if self.state == OPEN:
+                status['retry_in'] = round(max(0.0, self.opened_at + self.open_seconds - self.clock()), 1)
+            return status
+
+# Shared by all generator calls in this process
+openai_breaker = CircuitBreaker('openai')
@@ -0,0 +1,159 @@
+"""
+Rule-based Dutch grapheme-to-phoneme conversion for rhyme detection
+
+Words are transcribed into a compact phoneme string with one character
+per phoneme (loosely following the CELEX DISC notation):
+
+    A a     kat, kaart          E e     pet, peer
+    I i     pit, piet           O o     pot, poot
+    } y     put, puur           u       boek
+    |       neus                @       de (schwa)
+    K       tijd, meid          L       huis
+    M       vrouw, blauw        N       ring
+    x       lach, dag
+
+The rhyme key of a word is the part of its transcription from the last
+stressed vowel onwards, so 'tijd', 'wijt' and 'meid' all get 'Kt'.
+Everything works offline and the results are memoized.
+"""
+from functools import lru_cache
+
+VOWELS = set('AaEeIiOo}yu|@KLM')
+
+# Multi-letter graphemes, longest first. Vowels marked with '*' are
+# single letters whose length depends on the syllable they are in.
+GRAPHEMES = [
+    ('ieuw', 'iw'), ('eeuw', 'ew'), ('eau', 'o'),
+    ('aai', 'aj'), ('ooi', 'oj'), ('oei', 'uj'),
+    ('auw', 'M'), ('ouw', 'M'), ('sch', 'sx'),
+    ('au', 'M'), ('ou', 'M'), ('ij', 'K'), ('ei', 'K'), ('ui', 'L'),
+    ('oe', 'u'), ('ie', 'i'), ('eu', '|'), ('uw', 'yw'),
+    ('aa', 'a'), ('ee', 'e'), ('oo', 'o'), ('uu', 'y'),
+    # Loanwords like militair and affaire rhyme with -eer
+    ('ai', 'e'),
+    ('ch', 'x'), ('ng', 'N'), ('nk', 'Nk'), ('dt', 't'), ('th', 't'),
+    ('ph', 'f'), ('qu', 'kw'),
+]
+
+SINGLE = {
+    'b': 'b', 'c': 'k', 'd': 'd', 'f': 'f', 'g': 'x', 'h': 'h', 'j': 'j',
+    'k': 'k', 'l': 'l', 'm': 'm', 'n': 'n', 'p': 'p', 'q': 'k', 'r': 'r',
+    's': 's', 't': 't', 'v': 'v', 'w': 'w', 'x': 'ks', 'z': 'z',
+    'é': 'e', 'è': 'E', 'ê': 'E', 'ë': '*e', 'ï': 'i', 'ö': 'o', 'ü': 'y',
+    'a': '*a', 'e': '*e', 'i': '*i', 'o': '*o', 'u': '*u', 'y': '*y',
+}
+
+# Short and long variant of the single vowel letters
+SHORT = {'a': 'A', 'e': 'E', 'i': 'I', 'o': 'O', 'u': '}', 'y': 'i'}
+LONG = {'a': 'a', 'e': 'e', 'i': 'i', 'o': 'o', 'u': 'y', 'y': 'i'}
+
+# Word-final obstruents lose their voice: hond -> hont, web -> wep
+DEVOICE = {'b': 'p', 'd': 't', 'v': 'f', 'z': 's'}
+
+# Codas after which a final-syllable 'e' is a schwa: spelen, appel, water
+SCHWA_CODAS = {'', 'n', 'l', 'r', 'ns', 'ls', 'rs', 'nd'}
+
+# -tie and -sie are unstressed in positie, actie and televisie, but carry
+# the stress in these words (and in -cratie: democratie)
+STRESSED_IE_WORDS = {'fantasie', 'hypocrisie', 'diplomatie', 'poesie'}
+
+# Stems before -lijk that leave the stress on it: gelijk, ongelijk
+STRESSED_LIJK_STEMS = {'', 'ge', 'be', 'ver', 'ont', 'onge'}
+
+def _split(word):
+    """Split a word into graphemes, (letters, phonemes) pairs"""
+    graphemes = []
+    i = 0
+    while i < len(word):
+        for letters, phonemes in GRAPHEMES:
+            if word.startswith(letters, i):
+                break
+        else:
+            letters = word[i]
+            phonemes = SINGLE.get(letters, '')
+            if letters == 'c' and word[i + 1:i + 2] in ('e', 'i', 'y'):
+                phonemes = 's'
+            elif letters == 'y' and word[i + 1:i + 2] in ('a', 'e', 'o', 'u'):
+                phonemes = 'j'
+        graphemes.append((letters, phonemes))
+        i += len(letters)
+    return graphemes
+
+def _unstressed_ie(word):
+    """Phonemes of an unstressed -tie or -sie ending (positie, actie,
+    televisie), or None. The rhyme then starts at the vowel before it."""
+    if len(word) < 5 or word[-3:] not in ('tie', 'sie') or word in STRESSED_IE_WORDS or \
+            word.endswith('cratie') or not any(c in 'aeiouy' for c in word[:-3]):
+        return None
+    after_vowel = word[-4] in 'aeiouy'
+    if word[-3] == 't':
+        return 'tsi' if after_vowel else 'si'
+    return 'zi' if after_vowel else 'si'
+
+def _is_vowel(phonemes):
+    return phonemes.startswith('*') or phonemes[:1] in VOWELS
+
+@lru_cache(maxsize=65536)
+def transcribe(word):
+    """Transcribe a cleaned, lowercase Dutch word into phonemes"""
+    suffix = ''
+    ie_ending = _unstressed_ie(word)
+    if ie_ending:
+        word, suffix = word[:-3], ie_ending
+    elif word.endswith('lijk') and word[:-4] not in STRESSED_LIJK_STEMS:
+        word, suffix = word[:-4], 'l@k'
+    elif word.endswith('ig') and len(word) > 3 and word[-3] not in 'aeiouy':
+        word, suffix = word[:-2], '@x'
+
+    graphemes = _split(word)
+    n_vowels = sum(1 for _, p in graphemes if _is_vowel(p)) + (1 if suffix else 0)
+    last_vowel = max((i for i, (_, p) in enumerate(graphemes) if _is_vowel(p)), default=-1)
+
+    result = []
+    for i, (letters, phonemes) in enumerate(graphemes):
+        if phonemes.startswith('*'):
+            letter = phonemes[1]
+            following = graphemes[i + 1:]
+            consonants = ''
+            for next_letters, next_phonemes in following:
+                if _is_vowel(next_phonemes):
+                    break
+                consonants += next_letters
+            next_is_vowel = len(consonants) < len(''.join(l for l, _ in following))
+            if letter == 'e' and i == last_vowel and n_vowels > 1 and consonants in SCHWA_CODAS \
+                    and not ie_ending:
+                phonemes = '@'
+            elif letter == 'e' and not following and not suffix:
+                phonemes = '@'
+            elif not following or (len(consonants) == 1 and next_is_vowel):
+                # Open syllable: long vowel
+                phonemes = LONG[letter]
+            else:
+                phonemes = SHORT[letter]
+        if result and phonemes and result[-1] == phonemes and not _is_vowel(phonemes):
+            # Doubled consonants are pronounced once: bakken -> bak@n
+            continue
+        result.append(phonemes)
+
+    phonemes = ''.join(result)
+    if suffix and phonemes[-1:] == suffix[0]:
+        # discussie -> dIsk}si
+        phonemes = phonemes[:-1]
+    if not suffix:
+        # Final devoicing on the last consonant
+        if phonemes[-1:] in DEVOICE:
+            phonemes = phonemes[:-1] + DEVOICE[phonemes[-1]]
+    return phonemes + suffix
+
+@lru_cache(maxsize=65536)
+def rhyme_key(word):
+    """Get the phonetic rhyme key (nucleus plus coda) of a cleaned word"""
+    phonemes = transcribe(word)
+    nuclei = [i for i, p in enumerate(phonemes) if p in VOWELS]
+    if not nuclei:
+        return ''
+    start = nuclei[-1]
+    if (phonemes[start] == '@' or _unstressed_ie(word)) and len(nuclei) > 1:
+        # Unstressed final syllable, the rhyme starts one vowel earlier
+        start = nuclei[-2]
+    return phonemes[start:]
@@ -0,0 +1,172 @@
+"""
+Process-wide registry of pre-parsed PDF fonts
+
+FPDF.add_font() reads and parses the complete TTF file and rebuilds the
+glyph width table for every document. Here each font file is parsed once
+per process into a prototype TTFFont; documents get a cheap copy of it
+that only has its own subset state and its own lazily opened fontTools
+object (FPDF subsets that one in place when the PDF is written).
+
+Fonts are looked up in the bundled fonts/ directory, which the Vercel
+build fills with:
+
+    python font_registry.py fetch
+
+Nothing is downloaded at runtime unless RIJM_FONT_DOWNLOAD=1.
+"""
+import argparse
+import copy
+from io import BytesIO
+import os
+import sys
+import threading
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.fonts import TTFFont
+import requests
+
+BUNDLED_FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+ALLOW_DOWNLOAD = os.environ.get('RIJM_FONT_DOWNLOAD', '0') == '1'
+
+def is_font_file(data):
+    """Check the magic number of a TrueType or OpenType font"""
+    return data[:4] in (b'\x00\x01\x00\x00', b'true', b'OTTO')
+
+def download_font(url, path):
+    """Download a font file, returns its bytes"""
+    response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=30)
+    response.raise_for_status()
+    if not is_font_file(response.content):
+        raise ValueError(f"Geen geldig lettertype: {url}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(response.content)
+    os.replace(tmp_path, path)
+    return response.content
+
+class ParsedFont:
+    """A font file parsed once, ready to be attached to documents"""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        # The prototype is built against a throwaway document, only its
+        # metrics and initial subset are reused
+        self.prototype = TTFFont(FPDF(), path, 'prototype', '')
+        self.prototype.ttfont.close()
+        self.prototype.ttfont = None
+
+    def attach(self, pdf, family):
+        """Register the font on a document under the given family name"""
+        fontkey = family.lower()
+        if fontkey in pdf.fonts:
+            return
+        font = copy.copy(self.prototype)
+        font.i = len(pdf.fonts) + 1
+        font.fontkey = fontkey
+        font.missing_glyphs = []
+        font.ttfont = ttLib.TTFont(BytesIO(self.data), recalcTimestamp=False, fontNumber=0, lazy=True)
+        # Each document fills its own subset, the glyphs themselves are immutable
+        font.subset = copy.copy(self.prototype.subset)
+        font.subset.font = font
+        font.subset._map = dict(self.prototype.subset._map)
+        font.subset._reserved = list(self.prototype.subset._reserved)
+        pdf.fonts[fontkey] = font
+
+# Shared by all PDF generators in this process, keyed on the font file path
+_parsed = {}
+_lock = threading.Lock()
+
+def parse_font(path):
+    """Parse a font file, or return the copy parsed earlier"""
+    with _lock:
+        parsed = _parsed.get(path)
+        if parsed is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if not is_font_file(data):
+                raise ValueError(f"Ongeldig lettertype: {path}")
+            parsed = _parsed[path] = ParsedFont(path, data)
+        return parsed
+
+class FontRegistry:
+    """The fonts of a PDF generator, parsed and ready to attach"""
+
+    def __init__(self, fonts, fonts_dirs, download_dir=None, allow_download=ALLOW_DOWNLOAD):
+        self.fonts = fonts
+        self.fonts_dirs = fonts_dirs
+        self.download_dir = download_dir or fonts_dirs[-1]
+        self.allow_download = allow_download
+        self.parsed = {}
+
+    def find(self, font_info):
+        """Path of the font file in the first directory that has it"""
+        for fonts_dir in self.fonts_dirs:
+            path = os.path.join(fonts_dir, font_info['filename'])
+            if os.path.exists(path):
+                return path
+        if self.allow_download:
+            path = os.path.join(self.download_dir, font_info['filename'])
+            print(f"Downloading font: {font_info['name']}")
+            download_font(font_info['url'], path)
+            return path
+        return None
+
+    def load(self):
+        """Parse all fonts that are available, returns font id -> info"""
+        available_fonts = {}
+        for font_id, font_info in self.fonts.items():
+            try:
+                path = self.find(font_info)
+                if path is None:
+                    print(f"Font not found: {font_info['name']} (run: python font_registry.py fetch)")
+                    continue
+                self.parsed[font_id] = parse_font(path)
+                available_fonts[font_id] = {
+                    'name': font_info['name'],
+                    'path': path
+                }
+            except Exception as e:
+                print(f"Error with font {font_info['name']}: {str(e)}")
+        return available_fonts
+
+    def attach(self, pdf, font_id, family):
+        """Add a parsed font to a document, returns False if it is unavailable"""
+        parsed = self.parsed.get(font_id)
+        if parsed is None:
+            return False
+        parsed.attach(pdf, family)
+        return True
+
+def fetch_fonts(fonts, fonts_dir=BUNDLED_FONTS_DIR):
+    """Download all fonts that are missing from the fonts directory,
+    returns the names of the fonts that could not be fetched"""
+    failed = []
+    for font_info in fonts.values():
+        path = os.path.join(fonts_dir, font_info['filename'])
+        if os.path.exists(path):
+            continue
+        try:
+            download_font(font_info['url'], path)
+            print(f"Opgehaald: {font_info['name']} -> {path}")
+        except Exception as e:
+            print(f"Kon {font_info['name']} niet ophalen: {str(e)}")
+            failed.append(font_info['name'])
+    return failed
+
+def main():
+    from pdf_generator import PoemPDFGenerator
+
+    parser = argparse.ArgumentParser(description="Beheer de lettertypen voor de PDF export")
+    parser.add_argument('command', choices=['fetch'], help="fetch: download ontbrekende lettertypen")
+    parser.add_argument('-d', '--dir', default=BUNDLED_FONTS_DIR, help="Map met de lettertypen")
+    args = parser.parse_args()
+
+    if args.command == 'fetch':
+        # A failed fetch fails the build, instead of shipping without fonts
+        if fetch_fonts(PoemPDFGenerator.FONTS, args.dir):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
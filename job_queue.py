@@ -0,0 +1,177 @@
+"""
+Persistent background job queue
+
+Jobs are rows in a local SQLite table (WAL mode), so they survive a
+restart and every worker process on the machine can pick them up. A
+worker claims a job with a lease; a job whose lease ran out because its
+process died is claimed again by the next worker that looks, without
+stealing jobs that are still running elsewhere.
+
+Each process runs a few daemon threads that take jobs from the queue
+and pass their payload to the handler registered for the job kind. A job
+is tried at most max_attempts times, also when its process keeps dying.
+
+On serverless platforms like Vercel none of this holds: an instance is
+frozen between requests, so daemon threads do not run, and /tmp is not
+shared between instances or kept across cold starts. There the queue
+runs inline: enqueue() runs the job in the request that created it.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from storage import ThreadConnections
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class JobQueue:
+    """SQLite-backed queue with worker threads"""
+
+    def __init__(self, path, workers=1, lease_seconds=120, max_attempts=3, poll_interval=1.0, inline=False):
+        self.path = path
+        self.workers = 0 if inline else workers
+        self.inline = inline
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        # Autocommit mode, transactions are started explicitly
+        self.connections = ThreadConnections(path, self.create_table, isolation_level=None)
+        self.wakeup = threading.Event()
+        self.started = False
+        self.start_lock = threading.Lock()
+
+    def connect(self):
+        return self.connections.get()
+
+    def create_table(self, conn):
+        conn.row_factory = sqlite3.Row
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_until REAL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+
+    def register(self, kind, handler):
+        """Handle jobs of a kind with handler(payload), which returns the result"""
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload):
+        """Store a job and wake up a worker, or run it now when the queue is
+        inline. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.connect().execute('''INSERT INTO jobs (id, kind, payload, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)''', (job_id, kind, json.dumps(payload), QUEUED, now, now))
+        if self.inline:
+            # Until it is done or out of attempts
+            while self.run_one(job_id):
+                pass
+            return job_id
+        self.start()
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Status of a job, or None if it does not exist"""
+        row = self.connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'attempts': row['attempts']
+        }
+
+    def claim(self, job_id=None):
+        """Take the oldest queued job, or a running one whose lease expired.
+        A job that already used all its attempts is marked failed instead."""
+        conn = self.connect()
+        now = time.time()
+        only_job = 'AND id = ?' if job_id else ''
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # The process running its last attempt died
+            conn.execute('''UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ?
+                WHERE status = ? AND lease_until < ? AND attempts >= ?''',
+                         (FAILED, 'Maximaal aantal pogingen bereikt', now, RUNNING, now, self.max_attempts))
+            row = conn.execute(f'''SELECT id, kind, payload, attempts FROM jobs
+                WHERE (status = ? OR (status = ? AND lease_until < ? AND attempts < ?)) {only_job}
+                ORDER BY created_at LIMIT 1''',
+                               (QUEUED, RUNNING, now, self.max_attempts) + ((job_id,) if job_id else ())).fetchone()
+            if row is not None:
+                conn.execute('''UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ?
+                    WHERE id = ?''', (RUNNING, now + self.lease_seconds, now, row['id']))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def finish(self, job_id, status, result=None, error=None):
+        self.connect().execute('''UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ?
+            WHERE id = ?''', (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+
+    def run_one(self, job_id=None):
+        """Run the next job (or the given one), returns False if there was none"""
+        job = self.claim(job_id)
+        if job is None:
+            return False
+        handler = self.handlers.get(job['kind'])
+        try:
+            if handler is None:
+                raise ValueError(f"Onbekend soort taak: {job['kind']}")
+            result = handler(json.loads(job['payload']))
+            self.finish(job['id'], DONE, result=result)
+        except Exception as e:
+            print(f"Fout bij taak {job['id']} ({job['kind']}): {str(e)}")
+            if job['attempts'] + 1 >= self.max_attempts:
+                self.finish(job['id'], FAILED, error=str(e))
+            else:
+                self.finish(job['id'], QUEUED, error=str(e))
+        return True
+
+    def work(self):
+        while True:
+            try:
+                if self.run_one():
+                    continue
+            except Exception as e:
+                print(f"Fout in de takenrij: {str(e)}")
+            # Jobs from other processes are found by polling
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def purge(self, older_than=7 * 24 * 3600):
+        """Remove finished jobs older than the given number of seconds"""
+        self.connect().execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                               (DONE, FAILED, time.time() - older_than))
+
+    def start(self):
+        """Start the worker threads of this process, once"""
+        with self.start_lock:
+            if self.started:
+                return
+            self.purge()
+            for i in range(self.workers):
+                threading.Thread(target=self.work, name=f"job worker {i}", daemon=True).start()
+            self.started = True
+
+    def stats(self):
+        rows = self.connect().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
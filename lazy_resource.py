@@ -0,0 +1,80 @@
+"""
+Lazily loaded resources with a readiness state
+
+Expensive resources (scraped poems, fonts) are not loaded at import
+time. They load on first use, or earlier in a background warm-up
+thread, and report whether they are ready.
+"""
+import threading
+import time
+
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+class LazyResource:
+    """A value that is produced by `loader` the first time it is needed"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+        # Separate from self.lock, which is held for the whole load
+        self.warm_up_lock = threading.Lock()
+        self.warming_up = False
+
+    def get(self):
+        """Return the value, loading it now or waiting for a warm-up in progress"""
+        if self.state != READY:
+            with self.lock:
+                if self.state != READY:
+                    self.load()
+        return self.value
+
+    def load(self):
+        self.state = LOADING
+        start = time.monotonic()
+        try:
+            self.value = self.loader()
+        except Exception as e:
+            # A later get() tries again
+            self.state = FAILED
+            self.error = str(e)
+            raise
+        self.error = None
+        self.load_seconds = round(time.monotonic() - start, 3)
+        self.state = READY
+
+    def warm_up(self):
+        """Start loading in a background thread, unless it is loaded or a
+        warm-up is already running"""
+        with self.warm_up_lock:
+            if self.state == READY or self.warming_up:
+                return
+            self.warming_up = True
+
+        def run():
+            try:
+                self.get()
+            except Exception as e:
+                print(f"Fout bij het laden van {self.name}: {str(e)}")
+            finally:
+                self.warming_up = False
+
+        threading.Thread(target=run, name=f"warm-up {self.name}", daemon=True).start()
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def status(self):
+        return {
+            'state': self.state,
+            'error': self.error,
+            'load_seconds': self.load_seconds
+        }
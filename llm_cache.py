@@ -0,0 +1,223 @@
+"""
+Response cache and request coalescing for OpenAI calls
+
+Responses are keyed on the normalized request (model, messages,
+temperature, max_tokens) and stored in a chain of tiers: a small
+in-process LRU in front of a local SQLite database that survives
+restarts and is shared by all workers on the machine. Identical
+requests that are in flight at the same time share one upstream call.
+"""
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+from storage import ThreadConnections, storage_path
+from tiered_cache import TieredCache
+
+CACHE_PATH = os.environ.get('RIJM_LLM_CACHE', storage_path('llm_cache.sqlite3'))
+CACHE_TTL = float(os.environ.get('RIJM_LLM_CACHE_TTL', 7 * 24 * 3600))
+
+def normalize_text(text):
+    """Collapse whitespace so reformatted prompts hit the same entry"""
+    return ' '.join(str(text).split())
+
+def make_cache_key(model, messages, temperature, max_tokens):
+    """Build the cache key of an OpenAI request"""
+    payload = {
+        'model': model,
+        'messages': [{'role': m['role'], 'content': normalize_text(m['content'])} for m in messages],
+        'temperature': temperature,
+        'max_tokens': max_tokens
+    }
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+class MemoryCache:
+    """In-process LRU tier"""
+
+    def __init__(self, max_entries=1024, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if time.time() - created_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class SQLiteCache:
+    """Local SQLite tier with TTL and a maximum number of entries.
+
+    A hit only reads: the access times used for eviction are collected in
+    memory and written together with the next set(), or once `touch_batch`
+    hits have piled up.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=50000, touch_batch=100):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.connections = ThreadConnections(path, self.create_table, timeout=5)
+        self.writes = 0
+        self.touched = {}
+        self.touched_lock = threading.Lock()
+
+    def connect(self):
+        return self.connections.get()
+
+    def create_table(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)')
+        conn.commit()
+
+    def get(self, key):
+        conn = self.connect()
+        now = time.time()
+        row = conn.execute('SELECT value FROM llm_cache WHERE key = ? AND created_at > ?',
+                           (key, now - self.ttl)).fetchone()
+        if row is None:
+            return None
+        with self.touched_lock:
+            self.touched[key] = now
+            flush = len(self.touched) >= self.touch_batch
+        if flush:
+            self.write_touched(conn)
+            conn.commit()
+        return row[0]
+
+    def set(self, key, value):
+        conn = self.connect()
+        now = time.time()
+        self.write_touched(conn)
+        conn.execute('INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)',
+                     (key, value, now, now))
+        self.writes += 1
+        if self.writes % 100 == 0:
+            self.evict(conn, now)
+        conn.commit()
+
+    def write_touched(self, conn):
+        """Write the collected access times, the caller commits"""
+        with self.touched_lock:
+            touched, self.touched = self.touched, {}
+        if touched:
+            conn.executemany('UPDATE llm_cache SET accessed_at = ? WHERE key = ?',
+                             [(accessed_at, key) for key, accessed_at in touched.items()])
+
+    def evict(self, conn, now):
+        """Drop expired entries and the least recently used ones over the limit"""
+        conn.execute('DELETE FROM llm_cache WHERE created_at <= ?', (now - self.ttl,))
+        conn.execute('''DELETE FROM llm_cache WHERE key IN (
+            SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+        )''', (self.max_entries,))
+
+class _Call:
+    """An upstream call that other callers are waiting on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Let concurrent callers with the same key share one upstream call"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.async_calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Call fn(), or wait for the identical call already in flight"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    async def do_async(self, key, coro_fn):
+        """Async variant of do(), coalescing calls within one event loop"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            future = self.async_calls.get((loop, key))
+            leader = future is None
+            if leader:
+                future = self.async_calls[(loop, key)] = loop.create_future()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark as retrieved, the leader raises it itself
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            with self.lock:
+                del self.async_calls[(loop, key)]
+
+    def stats(self):
+        with self.lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced}
+
+def create_default_cache():
+    """Memory LRU in front of the SQLite cache, or memory only when disabled"""
+    tiers = [MemoryCache()]
+    if CACHE_PATH.lower() != 'off':
+        tiers.append(SQLiteCache())
+    return TieredCache(tiers)
@@ -0,0 +1,294 @@
+"""
+Local, template-based poem engine
+
+Poems are built from couplets. The first line of a couplet is a template
+with slots for the recipient's name, hobby and gift; the second line is
+taken from a library of complete lines, indexed on the rhyme key of their
+last word. After the slots are filled, the rhyme key of the first line's
+last word selects the second lines that rhyme with it, so every couplet
+rhymes even when it ends on the gift or the hobby.
+
+Everything runs in memory without network access, so a poem takes a few
+milliseconds: fast enough to serve drafts while the AI is busy and as
+fallback when it is unavailable.
+"""
+import random
+import re
+from rijm_checker import get_last_word, rhyme_checker
+
+DEFAULT_THEME = 'sinterklaas'
+
+# First lines per role, theme specific where the wording needs it
+OPENINGS = {
+    'sinterklaas': [
+        "Sinterklaas kwam met de boot,",
+        "Het is weer die tijd van het jaar,",
+        "Op een koude decemberdag,",
+        "De Sint liep 's nachts over het dak,",
+        "Piet sloop door het huis in de nacht,",
+        "Met pepernoten in zijn zak,",
+    ],
+    'verjaardag': [
+        "Hoera, {name} is jarig vandaag,",
+        "Er is weer een jaar voorbij,",
+        "De slingers hangen, het is feest,",
+        "Vandaag is het een bijzondere dag,",
+    ],
+    'afscheid': [
+        "Het afscheid is nu echt daar,",
+        "Na al die jaren is het tijd,",
+        "Lieve {name}, je gaat ons verlaten,",
+        "Je vertrekt, en dat vinden we niet fijn,",
+    ],
+    'bedankt': [
+        "Voor alles wat je hebt gedaan,",
+        "Een dankjewel komt van mij,",
+        "Dit gedichtje is speciaal voor jou,",
+        "Lieve {name}, je was een echte ster,",
+    ],
+}
+
+HOBBY_LINES = [
+    "{name} is gek op {hobby},",
+    "Aan {hobby} denk je dag en nacht,",
+    "Als {name} met {hobby} bezig is, is het feest,",
+    "Je houdt van {hobby}, en dat is waar,",
+    "Met {hobby} ben jij een ster,",
+    "Van {hobby} krijg je nooit genoeg,",
+]
+
+GIFT_LINES = [
+    "Daarom krijg je dit jaar een {gift},",
+    "Speciaal voor jou is er een {gift},",
+    "Een {gift} heb ik voor jou bewaard,",
+    "Een {gift} met een strik erom, zo mooi,",
+    "Een {gift}, dat was mijn idee,",
+    "In dit pakje zit een {gift},",
+]
+
+CLOSINGS = {
+    'sinterklaas': [
+        "Veel plezier ermee, dat wens ik je zeer,",
+        "De Sint gaat nu weer naar huis,",
+        "Hartelijke groeten van de Sint en Piet,",
+        "Zo, nu weet je wat de Sint heeft bedacht,",
+    ],
+    'verjaardag': [
+        "Nog vele jaren, dat wens ik je zeer,",
+        "Maak er een mooi feest van vandaag,",
+        "Van harte gefeliciteerd, dat is klaar,",
+    ],
+    'afscheid': [
+        "We zullen je missen, heel erg veel,",
+        "Het ga je goed, waar je ook gaat,",
+        "Dus zwaai nog één keer naar ons allemaal,",
+    ],
+    'bedankt': [
+        "Nogmaals bedankt, van mij voor jou,",
+        "Bedankt voor alles, dat meen ik zeer,",
+        "Zonder jou was het nooit zo fijn,",
+    ],
+}
+
+# Second lines, indexed on the rhyme of their last word. Lines that
+# mention the Sint are only used for Sinterklaas poems.
+SECOND_LINES = {
+    'algemeen': [
+        "Op deze heel bijzondere dag!",
+        "En dat met een hele grote lach!",
+        "Zo is het weer een prachtig jaar!",
+        "Het ligt al helemaal voor je klaar!",
+        "Daar kan echt niemand tegenaan!",
+        "Zo zie je {name} vrolijk verder gaan!",
+        "Dat moet toch echt heel leuk zijn!",
+        "Een feest voor groot en klein!",
+        "En {name} vindt dat heel fijn!",
+        "Dat maakt {name} vast heel blij!",
+        "Met een groet van ons allemaal erbij!",
+        "Dat wordt vast een groot feest!",
+        "Je bent altijd zo lief geweest!",
+        "Want zoiets leuks is nooit te veel!",
+        "Jij bent van ons een heel belangrijk deel!",
+        "Dat weten we allemaal maar al te wel!",
+        "Dat is voor jou een kinderspel!",
+        "Dat vind je leuk, in ieder geval!",
+        "Dat is voor jou toch echt een knal!",
+        "Met een kopje thee en een koek!",
+        "Dat komt bij jou precies van pas!",
+        "Zonder dat is het feest toch niets!",
+        "Dat is toch echt wel iets!",
+        "Dat wist je vast nog niet!",
+        "Daar zingen we een vrolijk lied!",
+        "Daar krijg je van mij een dikke zoen!",
+        "Dat is toch wat je graag wilt doen!",
+        "Daar is de vreugde groot!",
+        "Dat had je vast niet verwacht!",
+        "Dat wordt een feest, met pret en kracht!",
+        "Met een glimlach op je gezicht!",
+        "Daarom schreef ik dit gedicht!",
+        "Daar heb je vast geen spijt!",
+        "Daar neem je graag de tijd!",
+        "Dat doe je met heel veel plezier!",
+        "Daarom staan we allemaal hier!",
+        "Omdat iedereen van je houdt!",
+        "Het is meer waard dan goud!",
+        "Met een vrolijk stukje muziek!",
+        "Voor een groot en blij publiek!",
+        "Dat was al die tijd de hoop!",
+        "Dan voel je je snel weer thuis!",
+        "Daar wacht je nu niet meer zo lang!",
+        "Dit cadeautje is speciaal voor jou!",
+        "Dat doe je altijd heel trouw!",
+        "Pak het maar uit, en doe het gauw!",
+        "Daarom krijg je dit vandaag!",
+        "Dat doe je toch zo graag!",
+        "Dat is met heel veel liefde gemaakt!",
+        "Dat maakt deze dag heel wat waard!",
+        "Wat een prachtige tooi!",
+        "Daar kun je vast heel veel mee!",
+        "Daar kom je later vast heel ver!",
+        "Tot volgend jaar, dan zie ik je weer!",
+        "Want jij bent echt een fijne maat!",
+        "Daarom zeggen we het nog maar een keer!",
+        "Zo eindigt dan dit mooie verhaal!",
+        "Daarom krijg je dit cadeau!",
+        "Omdat iedereen je zo graag mag!",
+        "Daar geniet je van het allermeest!",
+        "Dat zien we allemaal van ver!",
+        "Dat is de moeite echt wel waard!",
+        "Zo gaat het feest verder, doe je mee?",
+        "Dat zijn we nog lang niet kwijt!",
+        "Een feestje vieren doen we graag!",
+        "Dat is echt helemaal jouw vak!",
+        "Dat zag iedereen al heel vroeg!",
+        "Daar moeten we nog even over praten!",
+    ],
+    'sinterklaas': [
+        "Omdat het van de Sint zo mag!",
+        "Dat weet de Sint, en dat is waar!",
+        "Dat heeft de Sint in zijn boek zien staan!",
+        "Sinterklaas is er ook bij!",
+        "Met groeten van de Sint en mij!",
+        "Dat weet de Sint maar al te wel!",
+        "Dat staat zo in het grote boek!",
+        "De Sint kwam even op bezoek!",
+        "Piet stopte het zelf in zijn tas!",
+        "Dat vertelde de Sint aan Piet!",
+        "In je mooie, blinkende schoen!",
+        "Met een heerlijke pepernoot!",
+        "Door Piet gebracht in de nacht!",
+        "Dat heeft de Sint zelf bedacht!",
+        "Piet sprong ermee over het dak!",
+        "Netjes verstopt in Sints grote zak!",
+        "Daarom schreef de Sint dit gedicht!",
+        "Van de Sint, die dat prachtig vindt!",
+        "Met een mooie strik en een lint!",
+        "Dat maakt de Sint heel erg verblijd!",
+        "Daarom is de Sint nu hier!",
+        "Omdat de Sint van je houdt!",
+        "Zo bracht Piet het bij jou thuis!",
+        "Door de schoorsteen in je huis!",
+        "Dat heeft Piet speciaal voor jou gemaakt!",
+        "Dat vindt de Sint een hele eer!",
+        "Gebracht door de Sint op zijn paard!",
+        "Door de schoorsteen, met een flinke gooi!",
+    ],
+}
+
+# Leading articles are already part of the templates
+ARTICLE_PATTERN = re.compile(r'^(een|de|het)\s+', re.IGNORECASE)
+
+def first_hobby(hobbies):
+    """The first hobby of a comma separated list"""
+    for hobby in (hobbies or '').split(','):
+        if hobby.strip():
+            return hobby.strip()
+    return ''
+
+def rhyme_of(line):
+    """Rhyme key of the last word of a line, or None"""
+    keys = rhyme_checker.get_rhyme_keys(get_last_word(line))
+    return keys[0] if keys else None
+
+def same_ending(word1, word2):
+    return word1.endswith(word2) or word2.endswith(word1)
+
+class LocalPoemEngine:
+    """Rhyming couplets from templates, without the AI"""
+
+    def __init__(self, second_lines=SECOND_LINES):
+        # rhyme key -> second lines, for Sinterklaas and for other themes
+        self.index = {'algemeen': {}, 'sinterklaas': {}}
+        for group, lines in second_lines.items():
+            for line in lines:
+                key = rhyme_of(line)
+                if key is None:
+                    continue
+                self.index['sinterklaas'].setdefault(key, []).append(line)
+                if group == 'algemeen':
+                    self.index['algemeen'].setdefault(key, []).append(line)
+
+    def slots(self, context):
+        gift = ARTICLE_PATTERN.sub('', (context.get('gift') or '').strip()) or 'cadeautje'
+        return {
+            'name': (context.get('name') or '').strip() or 'jij',
+            'gift': gift,
+            'hobby': first_hobby(context.get('hobbies'))
+        }
+
+    def partners(self, theme, line):
+        """Second lines that rhyme with a line, but do not end on the same word
+        (or a compound of it, like 'dag' and 'decemberdag')"""
+        index = self.index['sinterklaas' if theme == 'sinterklaas' else 'algemeen']
+        last_word = get_last_word(line)
+        return [partner for partner in index.get(rhyme_of(line), ())
+                if not same_ending(get_last_word(partner), last_word)]
+
+    def couplet(self, templates, slots, theme, used, rng):
+        """A rhyming couplet from the first templates that have a partner, or None"""
+        templates = list(templates)
+        rng.shuffle(templates)
+        for template in templates:
+            if '{hobby}' in template and not slots['hobby']:
+                continue
+            first = template.format(**slots)
+            partners = [partner for partner in self.partners(theme, first) if partner not in used]
+            if partners:
+                partner = rng.choice(partners)
+                used.add(partner)
+                return [capitalize(first), capitalize(partner.format(**slots))]
+        return None
+
+    def generate(self, context, seed=None):
+        """A poem of 6 lines (difficulty easy) or 8 lines, as a list of lines"""
+        rng = random.Random(seed)
+        theme = context.get('theme') if context.get('theme') in OPENINGS else DEFAULT_THEME
+        slots = self.slots(context)
+
+        roles = [OPENINGS[theme], HOBBY_LINES, GIFT_LINES, CLOSINGS[theme]]
+        if context.get('difficulty') == 'easy':
+            roles.remove(HOBBY_LINES)
+
+        lines = []
+        used = set()
+        for templates in roles:
+            couplet = self.couplet(templates, slots, theme, used, rng)
+            if couplet:
+                lines.extend(couplet)
+        return lines
+
+    def line(self, previous_line, context, seed=None):
+        """A line that rhymes with the previous line, or any fitting line"""
+        rng = random.Random(seed)
+        theme = context.get('theme') if context.get('theme') in OPENINGS else DEFAULT_THEME
+        slots = self.slots(context)
+        partners = self.partners(theme, previous_line) if previous_line else []
+        if not partners:
+            index = self.index['sinterklaas' if theme == 'sinterklaas' else 'algemeen']
+            partners = [line for lines in index.values() for line in lines]
+        return capitalize(rng.choice(partners).format(**slots))
+
+def capitalize(line):
+    return line[:1].upper() + line[1:]
+
+local_poems = LocalPoemEngine()
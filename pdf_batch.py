@@ -0,0 +1,151 @@
+"""
+Batch PDF export on a process pool
+
+FPDF rendering is pure Python and holds the GIL, so rendering a whole
+class or office worth of poems on threads does not get faster with more
+cores. Batches are rendered on a pool of worker processes instead, each
+of which parses the fonts once when it starts.
+
+Every poem in a batch is a dict with 'filename', 'lines' and optionally
+'formatting'. The output is a ZIP with one PDF per poem, or a single
+PDF with all poems one after the other. Both are streamed to the client
+as they are produced.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+import zipfile
+
+MAX_WORKERS = int(os.environ.get('RIJM_PDF_WORKERS', os.cpu_count() or 1))
+MAX_BATCH_SIZE = int(os.environ.get('RIJM_PDF_MAX_BATCH', 500))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Set in each worker process by init_worker
+_generator = None
+
+def init_worker():
+    """Create the PDF generator of a worker process and load its fonts"""
+    global _generator
+    from pdf_generator import PoemPDFGenerator
+    _generator = PoemPDFGenerator()
+    _generator.fonts.get()
+
+def render_poem(poem):
+    """Render one poem in a worker process"""
+    return _generator.generate_pdf_bytes(poem['lines'], poem.get('formatting'))
+
+def layout_poem(poem):
+    """Lay out one poem in a worker process, for a merged PDF"""
+    return _generator.layout(poem['lines'], poem.get('formatting'))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The shared worker pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers do not inherit the threads and open connections
+            # of the web process, unlike forked ones
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=init_worker)
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+def chunk_size(count):
+    """Poems per task: a few tasks per worker keeps all of them busy without
+    paying inter-process overhead for every single poem"""
+    return max(1, count // (MAX_WORKERS * 4))
+
+def render_chunk(poems):
+    """Render a few poems in a worker process"""
+    return [render_poem(poem) for poem in poems]
+
+def render_pdfs(poems):
+    """Yield (filename, pdf bytes) per poem, in the order of the batch
+
+    Only a couple of chunks per worker are in flight at a time, so finished
+    PDFs do not pile up when the client reads slower than the pool renders."""
+    pool = get_pool()
+    size = chunk_size(len(poems))
+    pending = deque()
+
+    def finished():
+        chunk, future = pending.popleft()
+        for poem, pdf_bytes in zip(chunk, future.result()):
+            yield poem['filename'], pdf_bytes
+
+    for i in range(0, len(poems), size):
+        chunk = poems[i:i + size]
+        pending.append((chunk, pool.submit(render_chunk, chunk)))
+        if len(pending) >= MAX_WORKERS * 2:
+            yield from finished()
+    while pending:
+        yield from finished()
+
+class ChunkSink:
+    """Write-only stream that hands out everything written since the last drain
+
+    It has no seek or tell, so zipfile writes it as a non-seekable stream,
+    with the sizes after each file instead of going back to fill them in."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_zip(poems):
+    """Yield a ZIP with one PDF per poem, a file at a time"""
+    sink = ChunkSink()
+    # PDFs are already compressed, storing them saves CPU
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, pdf_bytes in render_pdfs(poems):
+            archive.writestr(filename, pdf_bytes)
+            yield sink.drain()
+    # The central directory
+    yield sink.drain()
+
+def stream_merged_pdf(pdf_generator, poems):
+    """Yield one PDF containing all poems
+
+    The layouts are computed on the pool; the document itself is written in
+    this process, as there is no way to merge PDFs written by different
+    processes without an extra library. FPDF builds a document in memory,
+    so it is sent in slices of that single copy."""
+    plans = list(get_pool().map(layout_poem, poems, chunksize=chunk_size(len(poems))))
+    data = memoryview(pdf_generator.render_many(plans))
+    for i in range(0, len(data), STREAM_CHUNK_SIZE):
+        yield data[i:i + STREAM_CHUNK_SIZE]
+
+def stream_batch(pdf_generator, poems, output_format='zip'):
+    """Check a batch and return (chunk generator, mimetype)
+
+    Nothing is rendered until the generator is consumed."""
+    if not poems:
+        raise ValueError("Geen gedichten meegegeven")
+    if len(poems) > MAX_BATCH_SIZE:
+        raise ValueError(f"Maximaal {MAX_BATCH_SIZE} gedichten per keer")
+
+    if output_format == 'pdf':
+        return stream_merged_pdf(pdf_generator, poems), 'application/pdf'
+    return stream_zip(poems), 'application/zip'
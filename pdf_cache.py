@@ -0,0 +1,125 @@
+"""
+Content-addressed cache for rendered PDFs
+
+The preview is requested again after every formatting tweak, mostly with
+lines and formatting that were rendered before. Rendered PDFs are stored
+under a hash of everything that determines the output: the lines, the
+normalized formatting (including the resolved font) and the renderer
+version. The same hash serves as ETag, so a browser that already has the
+PDF gets a 304 without anything being rendered or even looked up.
+
+Entries live in an in-memory LRU bounded in bytes, in front of an
+optional directory on disk that is bounded in bytes as well.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+from tiered_cache import TieredCache
+
+MEMORY_MAX_BYTES = int(os.environ.get('RIJM_PDF_CACHE_MEMORY', 32 * 1024 * 1024))
+DISK_MAX_BYTES = int(os.environ.get('RIJM_PDF_CACHE_DISK', 256 * 1024 * 1024))
+
+def render_key(lines, options, renderer_version):
+    """Hash of the lines, normalized formatting and renderer version"""
+    payload = {
+        'lines': [str(line) for line in lines],
+        'options': options,
+        'renderer': renderer_version
+    }
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+class MemoryTier:
+    """LRU of rendered PDFs, bounded by their total size"""
+
+    def __init__(self, max_bytes=MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        # A single PDF larger than a quarter of the cache would evict too much
+        if len(data) > self.max_bytes // 4:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+class DiskTier:
+    """Rendered PDFs as files named after their key, bounded by total size"""
+
+    def __init__(self, directory, max_bytes=DISK_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Touch the file so eviction sees it as recently used
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+        return data
+
+    def set(self, key, data):
+        path = self.path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.writes += 1
+        if self.writes % 50 == 1:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used files until the directory fits"""
+        with self.lock:
+            files = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and len(entry.name) == 68 and entry.name.endswith('.pdf'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+def create_pdf_cache(directory=None):
+    """Memory LRU, in front of a directory on disk when one is given"""
+    tiers = [MemoryTier()]
+    if directory:
+        tiers.append(DiskTier(directory))
+    return TieredCache(tiers, name='PDF cache')
@@ -1,9 +1,46 @@
 import os
+from collections import namedtuple
 from fpdf import FPDF
-import requests
+from fpdf.fonts import CoreFont
 from datetime import datetime
+from font_registry import BUNDLED_FONTS_DIR, FontRegistry
+from lazy_resource import LazyResource
+from llm_cache import MemoryCache
+from pdf_cache import render_key
+from storage import storage_path
+
+# A5 page, all sizes in mm
+PAGE_WIDTH = 148
+PAGE_HEIGHT = 210
+PT_PER_MM = 72 / 25.4
+MIN_MARGIN = 2
+MAX_MARGIN = 40
+TEXT_PADDING = 4
+TITLE = "Sinterklaasgedicht"
+TITLE_HEIGHT = 20
+TITLE_GAP = 15
+FOOTER = "❦ Sint & Piet ❦"
+CORE_FOOTER = "~ Sint & Piet ~"
+FOOTER_SIZE = 8
+FOOTER_HEIGHT = 10
+FOOTER_GAP = 10
+ACCENT_COLOR = (139, 69, 19)
+TEXT_COLOR = (0, 0, 0)
+
+# Width table of the built-in font used when no handwritten font is available
+CORE_METRICS = CoreFont(FPDF(), 'helvetica', '')
+
+# A piece of text at its final position on a page
+TextBox = namedtuple('TextBox', ['text', 'x', 'y', 'width', 'height', 'size', 'color'])
+
+# Everything needed to write the PDF, without measuring text again
+LayoutPlan = namedtuple('LayoutPlan', ['font', 'margin', 'pages'])
 
 class PoemPDFGenerator:
+    # Bump when a change to the rendering changes the output, so cached PDFs
+    # are not served for it
+    RENDERER_VERSION = 2
+
     FONTS = {
         'homemade-apple': {
             'name': 'Homemade Apple',
@@ -28,126 +65,173 @@ class PoemPDFGenerator:
     }
 
     def __init__(self):
-        self.fonts_dir = os.path.join('/tmp' if os.environ.get('VERCEL') else os.path.dirname(__file__), 'fonts')
-        os.makedirs(self.fonts_dir, exist_ok=True)
-        self.available_fonts = self.setup_fonts()
+        # Bundled fonts, or a writable download location on Vercel
+        self.fonts_dir = storage_path('fonts')
+        # Lettertypen worden pas bij het eerste gebruik of in een warm-up thread geladen
+        self.fonts = LazyResource('lettertypen', self.setup_fonts)
+        # Layout plans per render key, shared by preview, download and save
+        self.layouts = MemoryCache(max_entries=256)
+
+    @property
+    def available_fonts(self):
+        return self.fonts.get()
     
     def setup_fonts(self):
-        """Download and setup all fonts"""
-        available_fonts = {}
-        for font_id, font_info in self.FONTS.items():
-            font_path = os.path.join(self.fonts_dir, font_info['filename'])
-            try:
-                if not os.path.exists(font_path):
-                    print(f"Downloading font: {font_info['name']}")
-                    response = requests.get(font_info['url'], headers={'User-Agent': 'Mozilla/5.0'})
-                    response.raise_for_status()  # Raise an error for bad status codes
-                    with open(font_path, 'wb') as f:
-                        f.write(response.content)
-                
-                # Verify the font file
-                with open(font_path, 'rb') as f:
-                    header = f.read(4)
-                    if header.startswith(b'\x00\x01\x00\x00') or header.startswith(b'true') or header.startswith(b'OTTO'):
-                        available_fonts[font_id] = {
-                            'name': font_info['name'],
-                            'path': font_path
-                        }
-                    else:
-                        print(f"Invalid font file for {font_info['name']}")
-                        if os.path.exists(font_path):
-                            os.remove(font_path)
-                        continue
-                        
-            except Exception as e:
-                print(f"Error with font {font_info['name']}: {str(e)}")
-                if os.path.exists(font_path):
-                    os.remove(font_path)
-                continue
-                
-        return available_fonts
+        """Parse all fonts once, from the bundled fonts directory"""
+        fonts_dirs = [BUNDLED_FONTS_DIR]
+        if self.fonts_dir != BUNDLED_FONTS_DIR:
+            fonts_dirs.append(self.fonts_dir)
+        self.registry = FontRegistry(self.FONTS, fonts_dirs)
+        return self.registry.load()
     
     def get_available_fonts(self):
         """Return list of available fonts"""
         return {font_id: info['name'] for font_id, info in self.available_fonts.items()}
 
+    def render_options(self, formatting=None):
+        """Normalize formatting to the values that determine the rendered PDF"""
+        formatting = formatting or {}
+        font = formatting.get('font', 'homemade-apple')
+        if font not in self.available_fonts:
+            font = 'Arial'
+        return {
+            'font': font,
+            'title_size': int(float(formatting.get('title_size', 16))),
+            'poem_size': int(float(formatting.get('poem_size', 12))),
+            'line_spacing': float(formatting.get('line_spacing', 1.5)),
+            'margin': min(max(float(formatting.get('margin', 20)), MIN_MARGIN), MAX_MARGIN)
+        }
+
+    def render_key(self, lines, formatting=None):
+        """Content address of the PDF rendered for these lines and formatting"""
+        return render_key(lines, self.render_options(formatting), self.RENDERER_VERSION)
+
+    def text_metrics(self, font):
+        """Font object whose width table is used for layout"""
+        if font in self.available_fonts:
+            return self.registry.parsed[font].prototype
+        return CORE_METRICS
+
+    def layout(self, lines, formatting=None):
+        """Compute where every line of text goes, cached per render key"""
+        options = self.render_options(formatting)
+        key = render_key(lines, options, self.RENDERER_VERSION)
+        plan = self.layouts.get(key)
+        if plan is None:
+            plan = self.compute_layout(lines, options)
+            self.layouts.set(key, plan)
+        return plan
+
+    def compute_layout(self, lines, options):
+        """Lay out the title, the poem lines and the footer over one or more A5 pages"""
+        font = options['font']
+        metrics = self.text_metrics(font)
+        core_font = metrics is CORE_METRICS
+        margin = options['margin']
+
+        def fit(text):
+            # Core fonts only have latin-1 glyphs
+            return text.encode('latin-1', 'replace').decode('latin-1') if core_font else text
+
+        def width(text, size):
+            return metrics.get_text_width(text, size, None)[1] / PT_PER_MM
+
+        # Text stays inside the decorative border
+        left = margin + TEXT_PADDING
+        text_width = PAGE_WIDTH - 2 * left
+        top = margin + TEXT_PADDING
+        bottom = PAGE_HEIGHT - margin - TEXT_PADDING
+
+        def box(text, y, height, size, color):
+            text = fit(text)
+            w = min(width(text, size), text_width)
+            return TextBox(text, left + (text_width - w) / 2, y, w, height, size, color)
+
+        pages = [[]]
+        y = top
+        pages[-1].append(box(TITLE, y, TITLE_HEIGHT, options['title_size'], ACCENT_COLOR))
+        y += TITLE_HEIGHT + TITLE_GAP
+
+        # Line height in mm follows the font size (pt * 0.5) and the chosen spacing
+        line_height = options['poem_size'] * 0.5 * options['line_spacing']
+        for line in lines:
+            for row in self.wrap(fit(str(line).strip()), options['poem_size'], text_width, width):
+                if y + line_height > bottom - FOOTER_HEIGHT:
+                    pages.append([])
+                    y = top
+                pages[-1].append(box(row, y, line_height, options['poem_size'], TEXT_COLOR))
+                y += line_height * 1.2
+
+        y += FOOTER_GAP
+        if y + FOOTER_HEIGHT > bottom:
+            pages.append([])
+            y = top
+        pages[-1].append(box(FOOTER if not core_font else CORE_FOOTER, y, FOOTER_HEIGHT, FOOTER_SIZE, ACCENT_COLOR))
+
+        return LayoutPlan(font, margin, tuple(tuple(page) for page in pages))
+
+    def wrap(self, text, size, max_width, width):
+        """Split a line into rows that fit the text width, at word boundaries"""
+        if not text or width(text, size) <= max_width:
+            return [text]
+        rows = []
+        row = ''
+        for word in text.split(' '):
+            candidate = f'{row} {word}' if row else word
+            if row and width(candidate, size) > max_width:
+                rows.append(row)
+                row = word
+            else:
+                row = candidate
+        rows.append(row)
+        return rows
+
+    def render(self, plan, target=None):
+        """Write a layout plan as PDF to a file path or a stream, or return the bytes"""
+        return self.render_many([plan], target)
+
+    def render_many(self, plans, target=None):
+        """Write several layout plans one after the other into a single PDF"""
+        pdf = FPDF(orientation='P', unit='mm', format='A5')
+        pdf.set_auto_page_break(auto=False)
+        # Plans may come from another process, make sure the fonts are loaded here
+        self.fonts.get()
+
+        for plan in plans:
+            font_family = 'helvetica'
+            if plan.font != 'Arial':
+                try:
+                    # Each font is embedded once, however many poems use it
+                    if self.registry.attach(pdf, plan.font, plan.font):
+                        font_family = plan.font
+                except Exception as e:
+                    print(f"Error loading font {plan.font}: {str(e)}")
+
+            for page in plan.pages:
+                pdf.add_page()
+
+                # Background and decorative border
+                pdf.set_fill_color(252, 252, 250)
+                pdf.rect(0, 0, PAGE_WIDTH, PAGE_HEIGHT, 'F')
+                pdf.set_draw_color(*ACCENT_COLOR)
+                pdf.rect(plan.margin, plan.margin, PAGE_WIDTH - 2 * plan.margin, PAGE_HEIGHT - 2 * plan.margin)
+
+                for text_box in page:
+                    pdf.set_font(font_family, size=text_box.size)
+                    pdf.set_text_color(*text_box.color)
+                    pdf.set_xy(text_box.x, text_box.y)
+                    pdf.cell(text_box.width, text_box.height, text_box.text, align='C')
+
+        if target is None:
+            return bytes(pdf.output())
+        if isinstance(target, (str, os.PathLike)):
+            pdf.output(target)
+        else:
+            target.write(pdf.output())
+        return target
+
     def generate_pdf(self, poem_lines, formatting=None, output_path=None):
         """Generate a PDF with the poem using specified formatting"""
-        if formatting is None:
-            formatting = {}
-        
-        # Default formatting values
-        font_id = formatting.get('font', 'homemade-apple')
-        title_size = float(formatting.get('title_size', 16))
-        poem_size = float(formatting.get('poem_size', 12))
-        line_spacing = float(formatting.get('line_spacing', 1.5))
-        margin = float(formatting.get('margin', 20))
-        
-        # Create PDF
-        pdf = FPDF(orientation='P', unit='mm', format='A5')
-        pdf.add_page()
-        
-        # Try to use the selected font, fall back to Arial if not available
-        font_family = "Arial"
-        if font_id in self.available_fonts:
-            try:
-                font_path = self.available_fonts[font_id]['path']
-                # Verify font file exists and is readable
-                if os.path.exists(font_path) and os.access(font_path, os.R_OK):
-                    pdf.add_font("CustomFont", "", font_path, uni=True)
-                    font_family = "CustomFont"
-                else:
-                    print(f"Font file not accessible: {font_id}")
-            except Exception as e:
-                print(f"Error loading font {font_id}: {str(e)}")
-        
-        # Set background color
-        pdf.set_fill_color(252, 252, 250)
-        pdf.rect(0, 0, 148, 210, 'F')
-        
-        # Add decorative border
-        pdf.set_draw_color(139, 69, 19)
-        pdf.rect(margin, margin, 148 - 2*margin, 210 - 2*margin)
-        
-        # Add title
-        pdf.set_font(font_family, size=int(title_size))
-        pdf.set_text_color(139, 69, 19)
-        pdf.cell(0, 20, "Sinterklaasgedicht", align='C', ln=True)
-        
-        # Add space before poem
-        pdf.ln(15)
-        
-        # Add poem text
-        pdf.set_font(font_family, size=int(poem_size))
-        pdf.set_text_color(0, 0, 0)
-        
-        # Calculate line spacing
-        available_height = 130
-        num_lines = len(poem_lines)
-        base_line_height = poem_size * 0.5  # Convert font size to mm
-        line_height = base_line_height * line_spacing
-        
-        # Calculate effective width for poem text (accounting for margins)
-        effective_width = 148 - 2*margin
-        
-        for line in poem_lines:
-            # Get width of text to calculate x position for centering
-            line_width = pdf.get_string_width(line)
-            x_offset = (effective_width - line_width) / 2 + margin
-            
-            # Move to centered position
-            pdf.set_x(x_offset)
-            pdf.cell(line_width, line_height, line, align='C')
-            pdf.ln(line_height * 1.2)  # Add extra space between lines
-        
-        # Add space before footer
-        pdf.ln(10)
-        
-        # Add footer
-        pdf.set_font(font_family, size=8)
-        pdf.set_text_color(139, 69, 19)
-        pdf.cell(0, 10, "❦ Sint & Piet ❦", align='C', ln=True)
-        
         # Generate output path if not provided
         if output_path is None:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -155,90 +239,12 @@ class PoemPDFGenerator:
             os.makedirs(output_dir, exist_ok=True)
             output_path = os.path.join(output_dir, f'sinterklaasgedicht_{timestamp}.pdf')
         
-        # Save the PDF
-        pdf.output(output_path)
-        return output_path
+        return self.render(self.layout(poem_lines, formatting), output_path)
 
     def generate_pdf_bytes(self, lines, formatting=None):
         """Generate PDF in memory and return the bytes"""
-        # Create PDF with Unicode support
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        
-        # Apply formatting if provided
-        if formatting:
-            font_family = formatting.get('font', 'Arial')
-            title_size = int(formatting.get('title_size', 16))
-            poem_size = int(formatting.get('poem_size', 12))
-            line_spacing = float(formatting.get('line_spacing', 1.5))
-        else:
-            font_family = 'Arial'
-            title_size = 16
-            poem_size = 12
-            line_spacing = 1.5
-        
-        # Add a page (A5 format)
-        pdf.add_page(format='A5')
-        
-        # Set margins (2mm)
-        margin = 2
-        pdf.set_margins(margin, margin)
-        
-        # Add font if it's one of our custom fonts
-        if font_family in self.FONTS:
-            font_path = os.path.join(self.fonts_dir, self.FONTS[font_family]['filename'])
-            try:
-                pdf.add_font(font_family, '', font_path, uni=True)
-            except Exception as e:
-                print(f"Error loading font {font_family}: {str(e)}")
-                font_family = 'Arial'
-        
-        # Set background color
-        pdf.set_fill_color(252, 252, 250)
-        pdf.rect(0, 0, 148, 210, 'F')
-        
-        # Add decorative border
-        pdf.set_draw_color(139, 69, 19)
-        pdf.rect(margin, margin, 148 - 2*margin, 210 - 2*margin)
-        
-        # Add title
-        pdf.set_font(font_family, size=int(title_size))
-        pdf.set_text_color(139, 69, 19)
-        pdf.cell(0, 20, "Sinterklaasgedicht", align='C', ln=True)
-        
-        # Add space before poem
-        pdf.ln(15)
-        
-        # Add poem text
-        pdf.set_font(font_family, size=int(poem_size))
-        pdf.set_text_color(0, 0, 0)
-        
-        # Calculate line spacing
-        available_height = 130
-        num_lines = len(lines)
-        base_line_height = poem_size * 0.5  # Convert font size to mm
-        line_height = base_line_height * line_spacing
-        
-        # Calculate effective width for poem text (accounting for margins)
-        effective_width = 148 - 2*margin
-        
-        for line in lines:
-            # Get width of text to calculate x position for centering
-            line_width = pdf.get_string_width(line)
-            x_offset = (effective_width - line_width) / 2 + margin
-            
-            # Move to centered position
-            pdf.set_x(x_offset)
-            pdf.multi_cell(line_width, line_height, line, align='C')
-            pdf.ln(line_height * 0.2)  # Add extra space between lines
-        
-        # Add space before footer
-        pdf.ln(10)
-        
-        # Add footer
-        pdf.set_font(font_family, size=8)
-        pdf.set_text_color(139, 69, 19)
-        pdf.cell(0, 10, "❦ Sint & Piet ❦", align='C', ln=True)
-        
-        # Return PDF bytes directly
-        return bytes(pdf.output(dest='S'))
+        return self.render(self.layout(lines, formatting))
+
+    def write_pdf(self, lines, formatting, stream):
+        """Generate PDF and write it to a binary stream"""
+        return self.render(self.layout(lines, formatting), stream)
@@ -0,0 +1,116 @@
+"""
+Local store of scraped Sinterklaas poems
+
+Poems are kept in a SQLite database on disk, deduplicated on a hash of
+their normalized text, with the time each poem was first and last seen.
+The HTTP validators (ETag, Last-Modified) of every fetched page are
+stored as well, so a refresh can ask the site whether anything changed
+instead of downloading and parsing it again.
+
+A crawl takes a lease in the same database first, so when several worker
+processes find the corpus stale at the same time only one of them
+crawls.
+"""
+import hashlib
+import os
+import time
+import uuid
+from storage import ThreadConnections, storage_path
+
+CORPUS_PATH = os.environ.get('RIJM_CORPUS', storage_path('poem_corpus.sqlite3'))
+
+def content_hash(text):
+    """Hash of a poem that ignores case and whitespace differences"""
+    normalized = ' '.join(text.lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+class PoemCorpus:
+    """Deduplicated poems and page validators in SQLite"""
+
+    def __init__(self, path=CORPUS_PATH):
+        self.path = path
+        self.connections = ThreadConnections(path, self.create_tables)
+
+    def connect(self):
+        return self.connections.get()
+
+    def create_tables(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS poems (
+            hash TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            source_url TEXT,
+            first_seen REAL NOT NULL,
+            fetched_at REAL NOT NULL
+        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL
+        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )''')
+        conn.commit()
+
+    def add_poems(self, poems, source_url=None, fetched_at=None):
+        """Store poems, returns how many were not in the corpus yet"""
+        conn = self.connect()
+        fetched_at = fetched_at or time.time()
+        before = conn.total_changes
+        conn.executemany('''INSERT INTO poems (hash, text, source_url, first_seen, fetched_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(hash) DO NOTHING''',
+                         [(content_hash(poem), poem, source_url, fetched_at, fetched_at) for poem in poems])
+        added = conn.total_changes - before
+        # Poems that were already known were seen again just now
+        conn.executemany('UPDATE poems SET fetched_at = ? WHERE hash = ?',
+                         [(fetched_at, content_hash(poem)) for poem in poems])
+        conn.commit()
+        return added
+
+    def poems(self):
+        """All poem texts, oldest first"""
+        return [row[0] for row in self.connect().execute('SELECT text FROM poems ORDER BY first_seen, hash')]
+
+    def count(self):
+        return self.connect().execute('SELECT COUNT(*) FROM poems').fetchone()[0]
+
+    def page(self, url):
+        """(etag, last_modified, fetched_at) of a page, or None if it was never fetched"""
+        return self.connect().execute('SELECT etag, last_modified, fetched_at FROM pages WHERE url = ?',
+                                      (url,)).fetchone()
+
+    def page_urls(self):
+        """URLs of all pages fetched before"""
+        return [row[0] for row in self.connect().execute('SELECT url FROM pages ORDER BY url')]
+
+    def save_page(self, url, etag=None, last_modified=None, fetched_at=None):
+        """Remember the validators of a fetched page"""
+        conn = self.connect()
+        conn.execute('''INSERT INTO pages (url, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = COALESCE(excluded.etag, etag),
+                last_modified = COALESCE(excluded.last_modified, last_modified),
+                fetched_at = excluded.fetched_at''',
+                     (url, etag, last_modified, fetched_at or time.time()))
+        conn.commit()
+
+    def acquire_lease(self, name, seconds):
+        """Take the lease of a name for some seconds, unless another holder
+        has it. Returns the holder token, or None."""
+        conn = self.connect()
+        holder = uuid.uuid4().hex
+        now = time.time()
+        conn.execute('''INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE leases.expires_at < ?''', (name, holder, now + seconds, now))
+        conn.commit()
+        row = conn.execute('SELECT holder FROM leases WHERE name = ?', (name,)).fetchone()
+        return holder if row is not None and row[0] == holder else None
+
+    def release_lease(self, name, holder):
+        conn = self.connect()
+        conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+        conn.commit()
@@ -1,16 +1,88 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
 from dotenv import load_dotenv
-import openai
-import random
+import httpx
+from openai import AsyncOpenAI, OpenAI, RateLimitError
 import time
+import weakref
+from circuit_breaker import CircuitOpen, openai_breaker
+from lazy_resource import LazyResource
+from llm_cache import SingleFlight, create_default_cache, make_cache_key
+from local_poems import local_poems
+from poem_index import build_index, context_query
+from prompts import TokenCounter, batch_prompt, system_prompt, user_prompt
+from rate_limiter import QueueTimeout, estimate_tokens, retry_after_seconds, scheduler
 from sint_scraper import SinterklaasGedichtenScraper
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-openai.api_key = os.getenv('OPENAI_API_KEY')
-client = openai
+MODEL = "gpt-4-1106-preview"
+
+# How poems are made: 'local' (templates, no AI), 'llm' (AI with the
+# templates as fallback) or 'local-then-llm' (templates while the AI limits
+# are reached, otherwise the AI)
+POEM_MODES = ('local', 'llm', 'local-then-llm')
+POEM_MODE = os.environ.get('RIJM_POEM_MODE', 'llm')
+# Poems per combined completion, and combined completions in flight at once
+BATCH_SIZE = int(os.environ.get('RIJM_BATCH_SIZE', 8))
+BATCH_CONCURRENCY = int(os.environ.get('RIJM_BATCH_CONCURRENCY', 4))
+MAX_GENERATE_BATCH = int(os.environ.get('RIJM_MAX_GENERATE_BATCH', 100))
+# Completion tokens per poem in a combined completion (JSON included), and
+# the completion limit of the model
+BATCH_TOKENS_PER_POEM = 250
+MAX_COMPLETION_TOKENS = 4096
+
+# Rough size of a poem request (prompt plus completion), for the load check
+POEM_REQUEST_TOKENS = 600
+
+# Number of example couplets from the corpus given to the model, 0 to disable
+FEW_SHOT_EXAMPLES = int(os.environ.get('RIJM_FEW_SHOT', 3))
+
+# Maximum number of open connections in each async connection pool
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 200))
+
+# OpenAI clients, created on first use
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_client():
+    """Gedeelde synchrone OpenAI client"""
+    global _client
+    if _client is None:
+        # Retries gaan via request_openai, zodat de circuit breaker elke poging ziet
+        _client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0,
+                         timeout=httpx.Timeout(60.0, connect=10.0))
+    return _client
+
+def get_async_client():
+    """Gedeelde async OpenAI client voor de huidige event loop.
+
+    Alle coroutines in dezelfde loop delen één connection pool; een httpx
+    pool kan niet tussen event loops gedeeld worden, vandaar één per loop.
+    """
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                                    max_keepalive_connections=ASYNC_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+        )
+        _async_clients[loop] = async_client
+    return async_client
+
+# Shared response cache and request coalescing for deterministic calls
+llm_cache = create_default_cache()
+single_flight = SingleFlight()
+# Input tokens of all requests
+token_counter = TokenCounter()
 
 # Initialize Sint scraper
 sint_scraper = SinterklaasGedichtenScraper()
@@ -26,9 +98,36 @@ class PoemGenerator:
         except ImportError:
             print("Waarschuwing: Rijmwoordenboek niet gevonden. Alleen basis gedichten worden gegenereerd.")
         
-        # Initialize Sint scraper
+        self.cache = llm_cache
+        self.single_flight = single_flight
+        self.token_counter = token_counter
+
+        # Sint scraper, de gedichten worden pas bij het eerste gebruik geladen
         self.sint_scraper = sint_scraper
-        self.sint_scraper.scrape_poems()
+        # Lokale gedichten uit sjablonen, zonder de AI
+        self.local_poems = local_poems
+        # Zoekindex over de voorbeeldgedichten, gebouwd bij het eerste gebruik
+        self.poem_index = LazyResource('voorbeeldindex', self.build_poem_index)
+
+    def build_poem_index(self):
+        """Bouw de zoekindex over het corpus en de bekende Sint-zinnen"""
+        self.sint_scraper.loader.get()
+        return build_index(self.sint_scraper.poems, self.sint_scraper.common_sint_phrases)
+
+    def example_couplets(self, context, k=FEW_SHOT_EXAMPLES):
+        """Voorbeeldcoupletten die het best passen bij de hobby's en het cadeau.
+        Wacht nooit op het corpus: zolang de index niet klaar is wordt hij op
+        de achtergrond gebouwd en gaat de prompt zonder voorbeelden."""
+        if k <= 0:
+            return []
+        if not self.poem_index.ready:
+            self.poem_index.warm_up()
+            return []
+        try:
+            return self.poem_index.get().top_k(context_query(context), k)
+        except Exception as e:
+            print(f"Fout bij het zoeken van voorbeelden: {str(e)}")
+            return []
 
     def get_person_info(self):
         """Verzamel informatie over de persoon waarvoor het gedicht is"""
@@ -64,41 +163,137 @@ class PoemGenerator:
             "difficulty": difficulty
         }
 
-    def call_openai_with_retry(self, messages, temperature=0.7, max_tokens=500, max_retries=3):
-        """Probeer OpenAI API aan te roepen met retry logic"""
+    def call_openai_with_retry(self, messages, temperature=0.7, max_tokens=500, max_retries=3,
+                               deterministic=False):
+        """Probeer OpenAI API aan te roepen met retry logic.
+
+        Met deterministic=True wordt hetzelfde verzoek uit de cache
+        beantwoord en delen gelijktijdige identieke verzoeken één
+        API-aanroep; creatieve aanroepen laten beide standaard links liggen.
+        Gebruik deterministic=True alleen met temperature=0, anders legt de
+        cache één willekeurig antwoord vast.
+        """
+        if not deterministic:
+            return self.request_openai(messages, temperature, max_tokens, max_retries)
+
+        cache_key = make_cache_key(MODEL, messages, temperature, max_tokens)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        def fetch():
+            content = self.request_openai(messages, temperature, max_tokens, max_retries)
+            self.cache.set(cache_key, content)
+            return content
+
+        return self.single_flight.do(cache_key, fetch)
+
+    def request_openai(self, messages, temperature, max_tokens, max_retries, **options):
+        """Roep de OpenAI API aan, met retries binnen de gedeelde limieten.
+        Extra opties (zoals response_format) gaan mee naar de API."""
+        tokens = estimate_tokens(messages, max_tokens)
         for attempt in range(max_retries):
             try:
-                response = client.ChatCompletion.create(
-                    model="gpt-4-1106-preview",
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
+                # Wacht op een plek binnen de gedeelde API limieten
+                scheduler.acquire(tokens)
+                # Een rate limit betekent dat de API wel antwoordt, dat telt niet als storing
+                with openai_breaker.call(ignore=(RateLimitError,)):
+                    response = get_client().chat.completions.create(
+                        model=MODEL,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        **options
+                    )
+                self.token_counter.add_response(response)
                 return response.choices[0].message.content
-            except openai.error.RateLimitError:
+            except CircuitOpen:
+                # Niet opnieuw proberen, de aanroeper valt direct terug
+                raise
+            except QueueTimeout:
+                raise Exception("Het is te druk bij de AI. Probeer het later opnieuw.")
+            except RateLimitError as e:
                 if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 20  # Exponential backoff
-                    print(f"\nEven wachten vanwege API limiet ({wait_time} seconden)...")
-                    time.sleep(wait_time)
+                    # Alle aanvragen in dit proces wachten samen, de scheduler houdt ze tegen
+                    wait_time = scheduler.backoff(attempt, retry_after_seconds(e))
+                    print(f"\nEven wachten vanwege API limiet ({wait_time:.1f} seconden)...")
                 else:
                     raise Exception("Kon geen verbinding maken met de AI. Probeer het later opnieuw.")
             except Exception as e:
                 print(f"Error: {str(e)}")
+                # Niet meer wachten als de circuit breaker inmiddels open staat
+                if attempt < max_retries - 1 and openai_breaker.available():
+                    time.sleep(scheduler.backoff(attempt, pause=False))
+                else:
+                    raise
+
+    async def call_openai_async(self, messages, temperature=0.7, max_tokens=500, max_retries=3,
+                                deterministic=False):
+        """Async variant van call_openai_with_retry: wachten blokkeert de worker niet"""
+        if not deterministic:
+            return await self.request_openai_async(messages, temperature, max_tokens, max_retries)
+
+        cache_key = make_cache_key(MODEL, messages, temperature, max_tokens)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        async def fetch():
+            content = await self.request_openai_async(messages, temperature, max_tokens, max_retries)
+            self.cache.set(cache_key, content)
+            return content
+
+        return await self.single_flight.do_async(cache_key, fetch)
+
+    async def request_openai_async(self, messages, temperature, max_tokens, max_retries):
+        """Async variant van request_openai"""
+        tokens = estimate_tokens(messages, max_tokens)
+        for attempt in range(max_retries):
+            try:
+                # Wacht op een plek binnen de gedeelde API limieten
+                await scheduler.acquire_async(tokens)
+                # Een rate limit betekent dat de API wel antwoordt, dat telt niet als storing
+                with openai_breaker.call(ignore=(RateLimitError,)):
+                    response = await get_async_client().chat.completions.create(
+                        model=MODEL,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+                self.token_counter.add_response(response)
+                return response.choices[0].message.content
+            except CircuitOpen:
+                # Niet opnieuw proberen, de aanroeper valt direct terug
+                raise
+            except QueueTimeout:
+                raise Exception("Het is te druk bij de AI. Probeer het later opnieuw.")
+            except RateLimitError as e:
                 if attempt < max_retries - 1:
-                    time.sleep(5)
+                    # Alle aanvragen in dit proces wachten samen, de scheduler houdt ze tegen
+                    wait_time = scheduler.backoff(attempt, retry_after_seconds(e))
+                    print(f"\nEven wachten vanwege API limiet ({wait_time:.1f} seconden)...")
+                else:
+                    raise Exception("Kon geen verbinding maken met de AI. Probeer het later opnieuw.")
+            except Exception as e:
+                print(f"Error: {str(e)}")
+                # Niet meer wachten als de circuit breaker inmiddels open staat
+                if attempt < max_retries - 1 and openai_breaker.available():
+                    await asyncio.sleep(scheduler.backoff(attempt, pause=False))
                 else:
                     raise
 
-    def suggest_rhyming_words(self, word):
-        """Get rhyming words for a given word using both dictionary and AI"""
-        rhyming_words = set()
-        
-        # First try the dictionary if available
-        if self.use_rhyme_check:
-            dict_words = self.rijmwoorden.get_rhyming_words(word.lower())
-            rhyming_words.update(dict_words)
-        
-        # Then use AI to generate more contextual rhyming words
+    def llm_stats(self):
+        """Tellers van de cache en het samenvoegen van verzoeken"""
+        return {
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            **self.single_flight.stats(),
+            'prompt_tokens': self.token_counter.stats(),
+            'circuit_breaker': openai_breaker.status()
+        }
+
+    def rhyming_words_messages(self, word):
+        """Bouw de berichten voor het opvragen van rijmwoorden"""
         prompt = f"""Geef 5 Nederlandse woorden die rijmen op '{word}'.
         De woorden moeten:
         1. Echt bestaande Nederlandse woorden zijn
@@ -108,14 +303,33 @@ class PoemGenerator:
         
         Geef alleen de woorden terug, gescheiden door komma's."""
         
+        return [{
+            "role": "system",
+            "content": "Je bent een expert in Nederlandse rijmwoorden."
+        }, {
+            "role": "user",
+            "content": prompt
+        }]
+
+    def dictionary_rhymes(self, word):
+        """Rijmwoorden uit het woordenboek, als dat beschikbaar is"""
+        rhyming_words = set()
+        if self.use_rhyme_check:
+            dict_words = self.rijmwoorden.get_rhyming_words(word.lower())
+            rhyming_words.update(dict_words)
+        return rhyming_words
+
+    def suggest_rhyming_words(self, word):
+        """Get rhyming words for a given word using both dictionary and AI"""
+        # First try the dictionary if available
+        rhyming_words = self.dictionary_rhymes(word)
+        
+        # Then use AI to generate more contextual rhyming words
         try:
-            response = self.call_openai_with_retry([{
-                "role": "system",
-                "content": "Je bent een expert in Nederlandse rijmwoorden."
-            }, {
-                "role": "user",
-                "content": prompt
-            }], temperature=0.7, max_tokens=100)
+            response = self.call_openai_with_retry(
+                self.rhyming_words_messages(word),
+                temperature=0, max_tokens=100, deterministic=True
+            )
             
             ai_words = [w.strip() for w in response.split(',')]
             rhyming_words.update(ai_words)
@@ -127,6 +341,20 @@ class PoemGenerator:
             # If AI fails, return dictionary words if available, otherwise empty list
             return sorted(list(rhyming_words)) if rhyming_words else []
 
+    async def suggest_rhyming_words_async(self, word):
+        """Async variant van suggest_rhyming_words"""
+        rhyming_words = self.dictionary_rhymes(word)
+        try:
+            response = await self.call_openai_async(
+                self.rhyming_words_messages(word),
+                temperature=0, max_tokens=100, deterministic=True
+            )
+            rhyming_words.update(w.strip() for w in response.split(','))
+            return sorted(list(rhyming_words))
+        except Exception as e:
+            print(f"Error suggesting rhyming words: {str(e)}")
+            return sorted(list(rhyming_words)) if rhyming_words else []
+
     def regenerate_line(self, line_index, current_lines):
         """Generate a new line that fits with the context of surrounding lines"""
         context = {
@@ -165,7 +393,7 @@ class PoemGenerator:
             print(f"Error generating new line: {str(e)}")
             raise
 
-    def analyze_poem_rhyme(self, poem):
+    def analyze_poem_rhyme(self, poem, scheme='aabb'):
         """Analyseer het rijmschema van het gedicht"""
         if not self.use_rhyme_check:
             return
@@ -173,93 +401,62 @@ class PoemGenerator:
         lines = [line.strip() for line in poem.split('\n') if line.strip()]
         print("\nRijmanalyse van het gedicht:")
         
-        for i in range(0, len(lines)-1, 2):
-            if i+1 < len(lines):
-                word1 = lines[i].split()[-1].lower().strip('.,!?')
-                word2 = lines[i+1].split()[-1].lower().strip('.,!?')
-                
-                # Haal rijmwoorden op voor het eerste woord
-                rhyming_words = self.rijmwoorden.get_rhyming_words(word1)
-                
-                if word2.lower() in [w.lower() for w in rhyming_words]:
-                    print(f"✓ '{word1}' rijmt met '{word2}'")
-                else:
-                    print(f"× '{word1}' rijmt niet met '{word2}'")
-                    print("Suggesties voor alternatieve rijmwoorden:")
-                    self.suggest_rhyming_words(word1)
+        # Alle regelparen in één keer controleren
+        for pair in self.rijmwoorden.check_scheme(lines, scheme):
+            word1, word2 = pair['words']
+            if pair['rhymes']:
+                print(f"✓ '{word1}' rijmt met '{word2}'")
+            else:
+                print(f"× '{word1}' rijmt niet met '{word2}'")
+                suggestions = self.rijmwoorden.get_rhyming_words(word1, limit=5)
+                if suggestions:
+                    print(f"Suggesties voor alternatieve rijmwoorden: {', '.join(suggestions)}")
 
     def generate_fallback_poem(self, context):
-        """Genereer een eenvoudig Sinterklaasgedicht zonder OpenAI"""
-        name = context['name']
-        gift = context['gift']
-        hobbies = context['hobbies'].split(',')[0] if ',' in context['hobbies'] else context['hobbies']
-        
-        templates = [
-            [
-                f"Op een koude decemberdag,",
-                f"Zag ik {name} met een grote lach,",
-                f"Bezig met {hobbies} zoals altijd,",
-                f"Dat maakt deze Sint zeer verblijd!",
-                f"Daarom krijg je dit jaar van mij,",
-                f"Een {gift}, dat maakt je vast heel blij!"
-            ],
-            [
-                f"Het is weer die tijd van het jaar,",
-                f"Met pepernoten hier en daar,",
-                f"En kijk eens wie ik daar zie staan,",
-                f"{name} komt er vrolijk aan!",
-                f"Een {gift} heb ik voor jou bewaard,",
-                f"Dat maakt deze dag heel wat waard!"
-            ],
-            [
-                f"De sterren schijnen aan de hemel zo mooi,",
-                f"De daken zijn met sneeuw bedekt, wat een tooi!",
-                f"En daar zie ik {name} die van {hobbies} houdt,",
-                f"Een passie die nooit zal worden oud!",
-                f"Speciaal voor jou heb ik dit jaar,",
-                f"Een {gift} met een strik, helemaal klaar!"
-            ]
-        ]
-        
-        return random.choice(templates)
+        """Genereer een rijmend gedicht uit sjablonen, zonder OpenAI"""
+        return self.local_poems.generate(context)
 
-    def generate_single_line(self, previous_line, context, target_words=None):
-        """Genereer een enkele regel die rijmt op de vorige regel, met een specifiek aantal woorden"""
-        try:
-            system_message = {
-                "role": "system",
-                "content": """Je bent een Nederlandse dichter, gespecialiseerd in rijmende regels.
-                Genereer één enkele dichtregel in natuurlijk Nederlands die rijmt op de gegeven regel.
-                
-                Richtlijnen:
-                - Gebruik ALLEEN natuurlijk, idiomatisch Nederlands
-                - Vermijd letterlijke vertalingen uit het Engels
-                - Gebruik correcte Nederlandse zinsconstructies
-                - Zorg dat de regel natuurlijk aanvoelt
-                - Maak de regel persoonlijk en relevant voor de context"""
-            }
-
-            user_message = {
-                "role": "user",
-                "content": f"""Schrijf één regel die rijmt op: "{previous_line}"
+    def single_line_messages(self, previous_line, context, target_words=None):
+        """Bouw de berichten voor het genereren van een enkele regel"""
+        system_message = {
+            "role": "system",
+            "content": """Je bent een Nederlandse dichter, gespecialiseerd in rijmende regels.
+            Genereer één enkele dichtregel in natuurlijk Nederlands die rijmt op de gegeven regel.
+            
+            Richtlijnen:
+            - Gebruik ALLEEN natuurlijk, idiomatisch Nederlands
+            - Vermijd letterlijke vertalingen uit het Engels
+            - Gebruik correcte Nederlandse zinsconstructies
+            - Zorg dat de regel natuurlijk aanvoelt
+            - Maak de regel persoonlijk en relevant voor de context"""
+        }
+
+        user_message = {
+            "role": "user",
+            "content": f"""Schrijf één regel die rijmt op: "{previous_line}"
 
-                Context over de persoon:
-                - Naam: {context['name']}
-                - {'Kind' if context['gender'] in ['jongen', 'meisje'] else 'Volwassene'}: {context['gender']}
-                - Cadeau: {context['gift']}
-                - Hobby's: {context['hobbies']}
+            Context over de persoon:
+            - Naam: {context['name']}
+            - {'Kind' if context['gender'] in ['jongen', 'meisje'] else 'Volwassene'}: {context['gender']}
+            - Cadeau: {context['gift']}
+            - Hobby's: {context['hobbies']}
 
-                De nieuwe regel moet:
-                - Rijmen op de vorige regel
-                - Natuurlijk Nederlands zijn
-                - Passen bij de context
-                - {f'Ongeveer {target_words} woorden bevatten' if target_words else 'Een passende lengte hebben'}
+            De nieuwe regel moet:
+            - Rijmen op de vorige regel
+            - Natuurlijk Nederlands zijn
+            - Passen bij de context
+            - {f'Ongeveer {target_words} woorden bevatten' if target_words else 'Een passende lengte hebben'}
 
-                Geef alleen de nieuwe regel terug, zonder extra tekst."""
-            }
+            Geef alleen de nieuwe regel terug, zonder extra tekst."""
+        }
+
+        return [system_message, user_message]
 
+    def generate_single_line(self, previous_line, context, target_words=None):
+        """Genereer een enkele regel die rijmt op de vorige regel, met een specifiek aantal woorden"""
+        try:
             response = self.call_openai_with_retry(
-                messages=[system_message, user_message],
+                messages=self.single_line_messages(previous_line, context, target_words),
                 temperature=0.7,
                 max_tokens=50
             )
@@ -267,58 +464,63 @@ class PoemGenerator:
             return response.strip()
             
         except Exception as e:
-            return self.generate_fallback_line(context)
-
-    def generate_fallback_line(self, context):
-        """Genereer een fallback regel als OpenAI niet beschikbaar is"""
-        fallback_lines = [
-            f"En {context['name']} vindt dat heel fijn!",
-            f"Met een {context['gift']} erbij!",
-            "Dat maakt deze dag zo blij!",
-            "Sinterklaas is er ook bij!",
-            "Dat vindt iedereen heel fijn!",
-            "Een feest voor groot en klein!",
-            "Dat moet wel heel leuk zijn!",
-            f"Want {context['name']} verdient iets bijzonders vandaag!",
-            "Een cadeautje met een lach!",
-            "Op deze speciale dag!"
-        ]
-        return random.choice(fallback_lines)
+            return self.generate_fallback_line(context, previous_line)
 
-    def get_alternative_words(self, word, context):
-        """Genereer alternatieve woorden die passen in de context"""
+    async def generate_single_line_async(self, previous_line, context, target_words=None):
+        """Async variant van generate_single_line"""
         try:
-            system_message = {
-                "role": "system",
-                "content": """Je bent een expert in de Nederlandse taal.
-                Genereer alternatieve Nederlandse woorden die natuurlijk passen in de context.
-                
-                Richtlijnen:
-                - Kies ALLEEN natuurlijke Nederlandse woorden
-                - Let op dat de woorden in de zinsconstructie passen
-                - Vermijd letterlijke vertalingen uit het Engels
-                - Kies woorden die passen bij Sinterklaasgedichten
-                - Houd rekening met formeel/informeel taalgebruik"""
-            }
+            response = await self.call_openai_async(
+                messages=self.single_line_messages(previous_line, context, target_words),
+                temperature=0.7,
+                max_tokens=50
+            )
+            return response.strip()
+        except Exception as e:
+            return self.generate_fallback_line(context, previous_line)
+
+    def generate_fallback_line(self, context, previous_line=None):
+        """Genereer een regel die rijmt op de vorige regel, zonder OpenAI"""
+        return self.local_poems.line(previous_line, context)
+
+    def alternative_words_messages(self, word, context):
+        """Bouw de berichten voor het opvragen van alternatieve woorden"""
+        system_message = {
+            "role": "system",
+            "content": """Je bent een expert in de Nederlandse taal.
+            Genereer alternatieve Nederlandse woorden die natuurlijk passen in de context.
             
-            user_message = {
-                "role": "user",
-                "content": f"""Geef 5 alternatieve Nederlandse woorden voor "{word}" die passen in deze context: "{context}"
-                
-                De woorden moeten:
-                1. Natuurlijk Nederlands zijn
-                2. Grammaticaal correct zijn op deze plek
-                3. Qua betekenis passen in de context
-                4. Ongeveer dezelfde lengte hebben
-                5. Passen bij de stijl van een Sinterklaasgedicht
-                
-                Geef alleen de woorden terug, gescheiden door komma's."""
-            }
+            Richtlijnen:
+            - Kies ALLEEN natuurlijke Nederlandse woorden
+            - Let op dat de woorden in de zinsconstructie passen
+            - Vermijd letterlijke vertalingen uit het Engels
+            - Kies woorden die passen bij Sinterklaasgedichten
+            - Houd rekening met formeel/informeel taalgebruik"""
+        }
+        
+        user_message = {
+            "role": "user",
+            "content": f"""Geef 5 alternatieve Nederlandse woorden voor "{word}" die passen in deze context: "{context}"
+            
+            De woorden moeten:
+            1. Natuurlijk Nederlands zijn
+            2. Grammaticaal correct zijn op deze plek
+            3. Qua betekenis passen in de context
+            4. Ongeveer dezelfde lengte hebben
+            5. Passen bij de stijl van een Sinterklaasgedicht
             
+            Geef alleen de woorden terug, gescheiden door komma's."""
+        }
+        
+        return [system_message, user_message]
+
+    def get_alternative_words(self, word, context):
+        """Genereer alternatieve woorden die passen in de context"""
+        try:
             response = self.call_openai_with_retry(
-                messages=[system_message, user_message],
-                temperature=0.7,
-                max_tokens=50
+                messages=self.alternative_words_messages(word, context),
+                temperature=0,
+                max_tokens=50,
+                deterministic=True
             )
             
             alternatives = [w.strip() for w in response.split(',')]
@@ -327,124 +529,215 @@ class PoemGenerator:
         except Exception as e:
             return []
 
-    def generate_poem(self, context):
-        """Genereer een Sinterklaasgedicht met context"""
-        is_child = context['gender'] in ['jongen', 'meisje']
+    async def get_alternative_words_async(self, word, context):
+        """Async variant van get_alternative_words"""
+        try:
+            response = await self.call_openai_async(
+                messages=self.alternative_words_messages(word, context),
+                temperature=0,
+                max_tokens=50,
+                deterministic=True
+            )
+            return [w.strip() for w in response.split(',')][:5]
+        except Exception as e:
+            return []
+
+    def poem_system_message(self, theme, difficulty):
+        """Het systeembericht voor gedichten, gelijk voor alle personen met hetzelfde thema en niveau"""
+        return {"role": "system", "content": system_prompt(theme, difficulty)}
+
+    def poem_messages(self, context):
+        """Bouw de berichten voor het genereren van een gedicht"""
         theme = context.get('theme', 'sinterklaas')
         difficulty = context.get('difficulty', 'medium')
-        
+
+        # Passende voorbeelden uit het corpus, als inspiratie voor toon en rijm
+        user_message = {
+            "role": "user",
+            "content": user_prompt(context, self.example_couplets(context))
+        }
+
+        return [self.poem_system_message(theme, difficulty), user_message]
+
+    def parse_poem(self, response):
+        """Splits het antwoord van de AI in gedichtregels"""
+        lines = [line.strip() for line in response.split('\n') if line.strip()]
+        return lines[:8]  # Maximaal 8 regels
+
+    def batch_messages(self, contexts):
+        """Bouw de berichten voor meerdere gedichten met hetzelfde thema en niveau in één keer"""
+        theme = contexts[0].get('theme', 'sinterklaas')
+        difficulty = contexts[0].get('difficulty', 'medium')
+        # Dezelfde voorbeelden als bij een los gedicht voor elke persoon
+        examples = [self.example_couplets(context) for context in contexts]
+        user_message = {
+            "role": "user",
+            "content": batch_prompt(contexts, examples)
+        }
+
+        return [self.poem_system_message(theme, difficulty), user_message]
+
+    def parse_batch(self, response, count):
+        """Haal de gedichten per persoon uit het JSON-antwoord; ontbrekende of
+        ongeldige gedichten zijn None"""
+        poems = [None] * count
         try:
-            # Bepaal de stijl op basis van moeilijkheidsgraad
-            style_guide = {
-                'easy': (
-                    "- Gebruik eenvoudige woorden en korte zinnen\n"
-                    "- Vermijd moeilijke constructies\n"
-                    "- Maak het speels en vrolijk\n"
-                    "- Gebruik veel concrete voorbeelden\n"
-                    "- Houd het tempo vlot"
-                ),
-                'medium': (
-                    "- Gebruik gevarieerd taalgebruik\n"
-                    "- Mix eenvoudige en complexere zinnen\n"
-                    "- Voeg wat woordgrapjes toe\n"
-                    "- Gebruik beeldspraak waar passend\n"
-                    "- Zorg voor een goede afwisseling"
-                ),
-                'hard': (
-                    "- Gebruik rijke taal en complexere zinstructuren\n"
-                    "- Voeg subtiele humor en woordspelingen toe\n"
-                    "- Gebruik creatieve beeldspraak\n"
-                    "- Maak verrassende verbanden\n"
-                    "- Voeg diepere lagen toe aan het gedicht"
-                )
-            }[difficulty]
-
-            # Bepaal thema-specifieke elementen
-            theme_elements = {
-                'sinterklaas': (
-                    "- Verwijs naar Sinterklaas en zijn Pieten\n"
-                    "- Gebruik traditionele Sinterklaas-elementen\n"
-                    "- Verwijs naar pakjesavond en surprises"
-                ),
-                'verjaardag': (
-                    "- Focus op de feestelijke gelegenheid\n"
-                    "- Verwijs naar leeftijd en groei\n"
-                    "- Gebruik vrolijke, feestelijke taal"
-                ),
-                'afscheid': (
-                    "- Toon waardering voor de persoon\n"
-                    "- Verwijs naar gedeelde herinneringen\n"
-                    "- Eindig met goede wensen voor de toekomst"
-                ),
-                'bedankt': (
-                    "- Uit oprechte dankbaarheid\n"
-                    "- Verwijs naar specifieke acties of momenten\n"
-                    "- Maak het persoonlijk en warm"
+            items = json.loads(response).get('gedichten', [])
+        except (ValueError, AttributeError):
+            return poems
+        for item in items if isinstance(items, list) else []:
+            try:
+                index = int(item['persoon']) - 1
+                lines = [str(line).strip() for line in item['regels'] if str(line).strip()]
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < count and len(lines) >= 2:
+                poems[index] = lines[:8]  # Maximaal 8 regels
+        return poems
+
+    def generate_batch(self, contexts):
+        """Genereer de gedichten van één groep in één API-aanroep; wie geen
+        geldig gedicht terugkrijgt, krijgt alsnog een eigen aanroep"""
+        poems = [None] * len(contexts)
+        if len(contexts) > 1:
+            try:
+                response = self.request_openai(
+                    self.batch_messages(contexts),
+                    temperature=0.8,
+                    max_tokens=min(BATCH_TOKENS_PER_POEM * len(contexts), MAX_COMPLETION_TOKENS),
+                    max_retries=3,
+                    response_format={"type": "json_object"}
                 )
-            }[theme]
+                poems = self.parse_batch(response, len(contexts))
+            except Exception as e:
+                print(f"Error generating poem batch: {str(e)}")
+        return [poem or self.generate_poem(context) for poem, context in zip(poems, contexts)]
 
-            system_message = {
-                "role": "system",
-                "content": f"""Je bent een Nederlandse dichter, gespecialiseerd in het schrijven van {theme}-gedichten.
-                Gebruik ALLEEN natuurlijk, idiomatisch Nederlands - geen vertalingen uit het Engels.
-                
-                Stijlniveau voor dit gedicht:
-                {style_guide}
-                
-                Thema-specifieke elementen:
-                {theme_elements}
-                
-                Belangrijke taalrichtlijnen:
-                - Gebruik Nederlandse zinsconstructies (NIET: 'Hij is aan het spelen games' maar 'Hij speelt graag spelletjes')
-                - Gebruik typisch Nederlandse uitdrukkingen en gezegden
-                - Vermijd letterlijke vertalingen uit het Engels
-                - Let op correcte werkwoordvolgorde in bijzinnen
-                - Gebruik natuurlijke Nederlandse woordvolgorde
-                
-                Stijlrichtlijnen:
-                - Maak het persoonlijk en origineel
-                - Gebruik humor die past bij het thema en niveau
-                - Vermijd clichés
-                - Zorg voor een originele, pakkende opening die past bij de context
-                - Gebruik rijm (bij voorkeur gepaard rijm: aabb)"""
-            }
-
-            user_message = {
-                "role": "user",
-                "content": f"""Schrijf een origineel {theme}-gedicht in natuurlijk Nederlands voor deze persoon:
-                
-                Persoon:
-                - Naam: {context['name']}
-                - {'Kind' if is_child else 'Volwassene'}: {context['gender']}
-                - Cadeau: {context['gift']}
-                - Hobby's: {context['hobbies']}
-                - Surprise: {'ja' if context['is_surprise'] else 'nee'}
-                
-                Het gedicht moet:
-                - Persoonlijk zijn en de context gebruiken
-                - 6-8 regels lang zijn
-                - Rijmen (aabb)
-                - Natuurlijk Nederlands gebruiken
-                - Een verrassende opening hebben
-                - Humor bevatten die past bij een {'kind' if is_child else 'volwassene'}
-                - Passen bij het gekozen thema: {theme}
-                - Qua moeilijkheid passen bij niveau: {difficulty}
-                
-                Begin direct met het gedicht, zonder inleiding."""
-            }
+    def generate_poems(self, contexts):
+        """Genereer gedichten voor meerdere personen.
+
+        Personen met hetzelfde thema en niveau delen één systeemprompt en
+        worden per BATCH_SIZE in één API-aanroep gevraagd; de groepen lopen
+        met hoogstens BATCH_CONCURRENCY tegelijk. Geeft per persoon de
+        regels terug, in dezelfde volgorde.
+        """
+        if len(contexts) > MAX_GENERATE_BATCH:
+            raise ValueError(f"Maximaal {MAX_GENERATE_BATCH} gedichten per keer")
+        poems = [None] * len(contexts)
+        groups = {}
+        for index, context in enumerate(contexts):
+            if self.use_local(context):
+                poems[index] = self.generate_fallback_poem(context)
+            else:
+                key = (context.get('theme', 'sinterklaas'), context.get('difficulty', 'medium'))
+                groups.setdefault(key, []).append(index)
+
+        batch_size = max(1, min(BATCH_SIZE, MAX_COMPLETION_TOKENS // BATCH_TOKENS_PER_POEM))
+        batches = [indices[i:i + batch_size] for indices in groups.values()
+                   for i in range(0, len(indices), batch_size)]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(batches))) as pool:
+                results = pool.map(lambda batch: self.generate_batch([contexts[i] for i in batch]), batches)
+                for batch, batch_poems in zip(batches, results):
+                    for index, poem in zip(batch, batch_poems):
+                        poems[index] = poem
+        return poems
 
+    def poem_mode(self, context):
+        """De gevraagde modus, of de standaard uit RIJM_POEM_MODE"""
+        mode = context.get('mode') or POEM_MODE
+        if mode not in POEM_MODES:
+            raise ValueError(f"Onbekende modus '{mode}', kies uit: {', '.join(POEM_MODES)}")
+        return mode
+
+    def use_local(self, context):
+        """Of het gedicht lokaal gemaakt wordt in plaats van door de AI"""
+        mode = self.poem_mode(context)
+        if mode == 'local' or not openai_breaker.available():
+            # Bij een storing van de AI direct lokaal, zonder retries
+            return True
+        if mode == 'local-then-llm':
+            # Alleen lokaal als een gedichtaanvraag nu op de API limieten zou moeten wachten
+            return scheduler.wait_estimate(POEM_REQUEST_TOKENS) > 0
+        return False
+
+    def generate_poem(self, context):
+        """Genereer een Sinterklaasgedicht met context"""
+        if self.use_local(context):
+            return self.generate_fallback_poem(context)
+        try:
             response = self.call_openai_with_retry(
-                messages=[system_message, user_message],
+                messages=self.poem_messages(context),
                 temperature=0.8,
                 max_tokens=200
             )
             
-            lines = [line.strip() for line in response.split('\n') if line.strip()]
-            return lines[:8]  # Maximaal 8 regels
+            return self.parse_poem(response)
             
         except Exception as e:
             return self.generate_fallback_poem(context)
 
+    def generate_poem_stream(self, context):
+        """Genereer een gedicht en geef elke regel terug zodra die binnen is"""
+        if self.use_local(context):
+            yield from self.generate_fallback_poem(context)
+            return
+        count = 0
+        stream = None
+        try:
+            messages = self.poem_messages(context)
+            scheduler.acquire(estimate_tokens(messages, 200))
+            # Een stream geeft geen usage terug, de invoer wordt geschat
+            self.token_counter.add(estimate_tokens(messages, 0), estimated=True)
+            # De breaker telt het hele lezen van de stream mee: een stream die
+            # opent en daarna blijft hangen of afbreekt is ook een storing.
+            # Een client die weggaat (GeneratorExit) is geen fout van de API.
+            with openai_breaker.call(ignore=(RateLimitError, GeneratorExit)):
+                stream = get_client().chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=0.8,
+                    max_tokens=200,
+                    stream=True
+                )
+                buffer = ''
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    buffer += chunk.choices[0].delta.content or ''
+                    while '\n' in buffer:
+                        line, buffer = buffer.split('\n', 1)
+                        if line.strip():
+                            yield line.strip()
+                            count += 1
+                            if count >= 8:  # Maximaal 8 regels
+                                return
+                if buffer.strip():
+                    yield buffer.strip()
+                
+        except Exception as e:
+            print(f"Error streaming poem: {str(e)}")
+            # Alleen terugvallen als er nog niets verstuurd is
+            if count == 0:
+                yield from self.generate_fallback_poem(context)
+        finally:
+            if stream is not None:
+                stream.response.close()
+
+    async def generate_poem_async(self, context):
+        """Async variant van generate_poem"""
+        if self.use_local(context):
+            return self.generate_fallback_poem(context)
+        try:
+            response = await self.call_openai_async(
+                messages=self.poem_messages(context),
+                temperature=0.8,
+                max_tokens=200
+            )
+            return self.parse_poem(response)
+        except Exception as e:
+            return self.generate_fallback_poem(context)
+
 def main():
     generator = PoemGenerator()
     
@@ -0,0 +1,102 @@
+"""
+BM25 index over example Sinterklaas couplets
+
+The scraped poems are split into couplets (pairs of consecutive lines)
+and indexed together with the common Sint phrases. A query built from
+the recipient's hobbies, gift and theme returns the most relevant
+couplets, which the generator passes to the model as examples.
+
+The BM25 weight of every (term, couplet) pair is computed when the index
+is built, so a query only adds up precomputed weights from the postings
+of its few terms instead of scoring every couplet.
+"""
+from collections import Counter, defaultdict
+import heapq
+import math
+import re
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-zà-öø-ÿ]+")
+
+STOPWORDS = frozenset("""
+aan al als bij dan dat de die dit doen door een en er ga gaat had heb heeft hem het hij hoe
+ik in is je jij jou jouw kan komt maar me met mij mijn na naar niet nog nu of om ook op over
+te tot u uit van veel voor want was wat we wel wie wil wij wordt zal ze zich zij zijn zo zou
+""".split())
+
+# Dutch diminutive and plural endings, longest first
+SUFFIXES = ('tjes', 'jes', 'tje', 'je', 'en', 's')
+
+def stem(token):
+    """Strip a plural or diminutive ending, so 'cadeautjes' matches 'cadeau'"""
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+def tokenize(text):
+    """Lowercased, stemmed content words of a text"""
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def split_couplets(poem):
+    """Split a poem into pairs of consecutive lines"""
+    lines = [line.strip() for line in poem.split('\n') if line.strip()]
+    if len(lines) <= 2:
+        return ['\n'.join(lines)] if lines else []
+    return ['\n'.join(lines[i:i + 2]) for i in range(0, len(lines) - 1, 2)]
+
+class PoemIndex:
+    """Inverted index from term to (couplet id, BM25 weight)"""
+
+    def __init__(self, documents):
+        self.documents = []
+        seen = set()
+        for document in documents:
+            if document and document not in seen:
+                seen.add(document)
+                self.documents.append(document)
+
+        term_counts = [Counter(tokenize(document)) for document in self.documents]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = sum(lengths) / len(lengths) if lengths else 0
+
+        document_frequency = Counter()
+        for counts in term_counts:
+            document_frequency.update(counts.keys())
+
+        n = len(self.documents)
+        self.postings = defaultdict(list)
+        for doc_id, counts in enumerate(term_counts):
+            norm = K1 * (1 - B + B * lengths[doc_id] / avg_length) if avg_length else K1
+            for term, tf in counts.items():
+                idf = math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                self.postings[term].append((doc_id, idf * tf * (K1 + 1) / (tf + norm)))
+        self.postings = dict(self.postings)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query, k=3):
+        """(score, couplet) of the k best matches of a query, best first"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for doc_id, weight in self.postings.get(term, ()):
+                scores[doc_id] += weight
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self.documents[doc_id]) for doc_id, score in best]
+
+    def top_k(self, query, k=3):
+        """The k couplets that best match a query"""
+        return [document for _, document in self.search(query, k)]
+
+def build_index(poems, phrases=()):
+    """Index the couplets of the poems and the loose phrases"""
+    documents = [couplet for poem in poems for couplet in split_couplets(poem)]
+    return PoemIndex(documents + list(phrases))
+
+def context_query(context):
+    """Search query for the examples that fit a recipient"""
+    return ' '.join(str(context.get(field) or '') for field in ('hobbies', 'gift', 'theme'))
@@ -0,0 +1,260 @@
+"""
+Prompts for poem generation
+
+The system prompt depends only on the theme and the difficulty, so all
+of them are rendered once at import into a read-only table; a request
+only looks its prompt up and fills in the short per-person template.
+Next to the full prompts there is a compact variant that gives the same
+instructions in fewer tokens (RIJM_PROMPT=compact).
+
+Compare the variants with the prompts as they were built before with:
+
+    python bench_prompts.py
+"""
+import os
+import threading
+from types import MappingProxyType
+
+PROMPT_VARIANTS = ('full', 'compact')
+PROMPT_VARIANT = os.environ.get('RIJM_PROMPT', 'full')
+if PROMPT_VARIANT not in PROMPT_VARIANTS:
+    raise ValueError(f"RIJM_PROMPT moet een van {', '.join(PROMPT_VARIANTS)} zijn, niet '{PROMPT_VARIANT}'")
+
+STYLE_GUIDES = MappingProxyType({
+    'easy': (
+        "- Gebruik eenvoudige woorden en korte zinnen\n"
+        "- Vermijd moeilijke constructies\n"
+        "- Maak het speels en vrolijk\n"
+        "- Gebruik veel concrete voorbeelden\n"
+        "- Houd het tempo vlot"
+    ),
+    'medium': (
+        "- Gebruik gevarieerd taalgebruik\n"
+        "- Mix eenvoudige en complexere zinnen\n"
+        "- Voeg wat woordgrapjes toe\n"
+        "- Gebruik beeldspraak waar passend\n"
+        "- Zorg voor een goede afwisseling"
+    ),
+    'hard': (
+        "- Gebruik rijke taal en complexere zinstructuren\n"
+        "- Voeg subtiele humor en woordspelingen toe\n"
+        "- Gebruik creatieve beeldspraak\n"
+        "- Maak verrassende verbanden\n"
+        "- Voeg diepere lagen toe aan het gedicht"
+    )
+})
+
+THEME_ELEMENTS = MappingProxyType({
+    'sinterklaas': (
+        "- Verwijs naar Sinterklaas en zijn Pieten\n"
+        "- Gebruik traditionele Sinterklaas-elementen\n"
+        "- Verwijs naar pakjesavond en surprises"
+    ),
+    'verjaardag': (
+        "- Focus op de feestelijke gelegenheid\n"
+        "- Verwijs naar leeftijd en groei\n"
+        "- Gebruik vrolijke, feestelijke taal"
+    ),
+    'afscheid': (
+        "- Toon waardering voor de persoon\n"
+        "- Verwijs naar gedeelde herinneringen\n"
+        "- Eindig met goede wensen voor de toekomst"
+    ),
+    'bedankt': (
+        "- Uit oprechte dankbaarheid\n"
+        "- Verwijs naar specifieke acties of momenten\n"
+        "- Maak het persoonlijk en warm"
+    )
+})
+
+SYSTEM_TEMPLATE = """Je bent een Nederlandse dichter, gespecialiseerd in het schrijven van {theme}-gedichten.
+Gebruik ALLEEN natuurlijk, idiomatisch Nederlands - geen vertalingen uit het Engels.
+
+Stijlniveau voor dit gedicht:
+{style_guide}
+
+Thema-specifieke elementen:
+{theme_elements}
+
+Belangrijke taalrichtlijnen:
+- Gebruik Nederlandse zinsconstructies (NIET: 'Hij is aan het spelen games' maar 'Hij speelt graag spelletjes')
+- Gebruik typisch Nederlandse uitdrukkingen en gezegden
+- Vermijd letterlijke vertalingen uit het Engels
+- Let op correcte werkwoordvolgorde in bijzinnen
+- Gebruik natuurlijke Nederlandse woordvolgorde
+
+Stijlrichtlijnen:
+- Maak het persoonlijk en origineel
+- Gebruik humor die past bij het thema en niveau
+- Vermijd clichés
+- Zorg voor een originele, pakkende opening die past bij de context
+- Gebruik rijm (bij voorkeur gepaard rijm: aabb)"""
+
+COMPACT_STYLE_GUIDES = MappingProxyType({
+    'easy': "eenvoudige woorden, korte zinnen, speels en vrolijk, concreet, vlot tempo",
+    'medium': "gevarieerde taal, korte en langere zinnen, wat woordgrapjes en beeldspraak",
+    'hard': "rijke taal, complexe zinnen, subtiele humor, woordspelingen, creatieve beeldspraak, diepere lagen"
+})
+
+COMPACT_THEME_ELEMENTS = MappingProxyType({
+    'sinterklaas': "Sinterklaas, Pieten, pakjesavond en surprises",
+    'verjaardag': "het feest, leeftijd en groei, feestelijke taal",
+    'afscheid': "waardering, gedeelde herinneringen, goede wensen voor de toekomst",
+    'bedankt': "oprechte dank voor concrete momenten, persoonlijk en warm"
+})
+
+COMPACT_SYSTEM_TEMPLATE = """Je bent een Nederlandse dichter van {theme}-gedichten. Schrijf natuurlijk, idiomatisch Nederlands met Nederlandse zinsbouw, woordvolgorde en uitdrukkingen, nooit vertaald uit het Engels.
+Stijl: {style_guide}.
+Thema: {theme_elements}.
+Persoonlijk en origineel, humor passend bij thema en niveau, geen clichés, pakkende opening, gepaard rijm (aabb)."""
+
+def build_system_prompt(theme, difficulty, variant='full'):
+    """Render the system prompt of a theme and difficulty"""
+    if variant == 'compact':
+        return COMPACT_SYSTEM_TEMPLATE.format(theme=theme, style_guide=COMPACT_STYLE_GUIDES[difficulty],
+                                              theme_elements=COMPACT_THEME_ELEMENTS[theme])
+    return SYSTEM_TEMPLATE.format(theme=theme, style_guide=STYLE_GUIDES[difficulty],
+                                  theme_elements=THEME_ELEMENTS[theme])
+
+# (variant, theme, difficulty) -> system prompt, rendered once
+SYSTEM_PROMPTS = MappingProxyType({
+    (variant, theme, difficulty): build_system_prompt(theme, difficulty, variant)
+    for variant in PROMPT_VARIANTS for theme in THEME_ELEMENTS for difficulty in STYLE_GUIDES
+})
+
+def system_prompt(theme, difficulty, variant=PROMPT_VARIANT):
+    """The precompiled system prompt, KeyError for an unknown theme or difficulty"""
+    return SYSTEM_PROMPTS[variant, theme, difficulty]
+
+# How a batch request asks for its answer, read back by PoemGenerator.parse_batch
+BATCH_ANSWER = {
+    'full': ('Antwoord alleen met JSON in deze vorm, met voor elke persoon één object:\n'
+             '{"gedichten": [{"persoon": 1, "regels": ["eerste regel", "tweede regel"]}]}'),
+    'compact': 'Alleen JSON, één object per persoon: {"gedichten": [{"persoon": 1, "regels": ["regel", "regel"]}]}'
+}
+
+def audience_of(context):
+    """Whether the poem is for a child or an adult"""
+    return 'kind' if context['gender'] in ['jongen', 'meisje'] else 'volwassene'
+
+def person_block(context, variant=PROMPT_VARIANT, number=None):
+    """The details of one person, numbered in a batch request"""
+    surprise = 'ja' if context.get('is_surprise') else 'nee'
+    label = f"Persoon {number}" if number else "Persoon"
+    if variant == 'compact':
+        return f"""{context['name']} ({context['gender']}, {audience_of(context)}). Cadeau: {context['gift']}. Hobby's: {context['hobbies']}. Surprise: {surprise}."""
+
+    return f"""{label}:
+- Naam: {context['name']}
+- {audience_of(context).capitalize()}: {context['gender']}
+- Cadeau: {context['gift']}
+- Hobby's: {context['hobbies']}
+- Surprise: {surprise}"""
+
+def requirements(theme, difficulty, audience, variant=PROMPT_VARIANT):
+    """What every poem must be, for a child, an adult or both"""
+    if variant == 'compact':
+        return f"6-8 regels, rijm aabb, verrassende opening, humor voor een {audience}, niveau {difficulty}."
+
+    return f"""- Persoonlijk zijn en de context gebruiken
+- 6-8 regels lang zijn
+- Rijmen (aabb)
+- Natuurlijk Nederlands gebruiken
+- Een verrassende opening hebben
+- Humor bevatten die past bij een {audience}
+- Passen bij het gekozen thema: {theme}
+- Qua moeilijkheid passen bij niveau: {difficulty}"""
+
+def examples_block(examples):
+    if not examples:
+        return ''
+    return "Voorbeelden van de gewenste toon (niet overnemen):\n" + "\n\n".join(examples)
+
+def user_prompt(context, examples=(), variant=PROMPT_VARIANT):
+    """The request for one person, with optional example couplets. An
+    f-string, because str.format would parse the template on every call."""
+    theme = context.get('theme', 'sinterklaas')
+    difficulty = context.get('difficulty', 'medium')
+    person = person_block(context, variant)
+    checklist = requirements(theme, difficulty, audience_of(context), variant)
+    examples_text = f"\n{examples_block(examples)}\n" if examples else ''
+
+    if variant == 'compact':
+        return f"""{theme}-gedicht voor {person}
+{checklist}
+{examples_text}Alleen het gedicht, zonder inleiding."""
+
+    return f"""Schrijf een origineel {theme}-gedicht in natuurlijk Nederlands voor deze persoon:
+
+{person}
+
+Het gedicht moet:
+{checklist}
+{examples_text}
+Begin direct met het gedicht, zonder inleiding."""
+
+def batch_prompt(contexts, examples, variant=PROMPT_VARIANT):
+    """The request for several people with the same theme and difficulty,
+    each with their own example couplets, answered as JSON"""
+    theme = contexts[0].get('theme', 'sinterklaas')
+    difficulty = contexts[0].get('difficulty', 'medium')
+    persons = []
+    for number, (context, person_examples) in enumerate(zip(contexts, examples), 1):
+        person = person_block(context, variant, number)
+        if variant == 'compact':
+            person = f"Persoon {number}: {person}"
+        if person_examples:
+            person += "\n" + examples_block(person_examples)
+        persons.append(person)
+    checklist = requirements(theme, difficulty, 'kind of volwassene, zoals bij de persoon staat', variant)
+
+    if variant == 'compact':
+        persons_text = "\n".join(persons)
+        return f"""{len(contexts)} verschillende {theme}-gedichten, één per persoon.
+{persons_text}
+Per gedicht: {checklist} Elk gedicht anders.
+{BATCH_ANSWER[variant]}"""
+
+    persons_text = "\n\n".join(persons)
+    return f"""Schrijf voor elk van deze {len(contexts)} personen een eigen, origineel {theme}-gedicht in natuurlijk Nederlands.
+
+{persons_text}
+
+Elk gedicht moet:
+{checklist}
+- Anders zijn dan de gedichten voor de andere personen
+
+{BATCH_ANSWER[variant]}"""
+
+class TokenCounter:
+    """Input tokens sent to the API by this process, as reported in the
+    usage of the responses. Streamed responses carry no usage, their
+    input is estimated."""
+
+    def __init__(self):
+        self.requests = 0
+        self.input_tokens = 0
+        self.estimated_requests = 0
+        self.lock = threading.Lock()
+
+    def add(self, tokens, estimated=False):
+        with self.lock:
+            self.requests += 1
+            self.input_tokens += tokens
+            if estimated:
+                self.estimated_requests += 1
+
+    def add_response(self, response):
+        """Count the input tokens the API reported for a response"""
+        usage = getattr(response, 'usage', None)
+        if usage is not None and usage.prompt_tokens is not None:
+            self.add(usage.prompt_tokens)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'input_tokens': self.input_tokens,
+            'input_tokens_per_request': round(self.input_tokens / self.requests, 1) if self.requests else 0.0,
+            'estimated_requests': self.estimated_requests,
+            'prompt_variant': PROMPT_VARIANT
+        }
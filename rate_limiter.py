@@ -0,0 +1,153 @@
+"""
+Process-wide scheduler for OpenAI requests
+
+All generator calls reserve capacity from shared token buckets for
+requests per minute and tokens per minute before they go out, so the
+process stays just under the API quota instead of running into it. On a
+rate limit every caller backs off together, for the time the API asks
+for in Retry-After or a jittered exponential delay, and nobody waits in
+the queue longer than the configured maximum.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+
+REQUESTS_PER_MINUTE = float(os.environ.get('OPENAI_RPM_LIMIT', 500))
+TOKENS_PER_MINUTE = float(os.environ.get('OPENAI_TPM_LIMIT', 30000))
+MAX_QUEUE_TIME = float(os.environ.get('OPENAI_MAX_QUEUE_TIME', 15))
+
+class QueueTimeout(Exception):
+    """Raised when a request would wait longer than the maximum queue time"""
+
+class TokenBucket:
+    """Token bucket that refills continuously up to its capacity"""
+
+    def __init__(self, capacity, per_second):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` is available, 0 if it is available now"""
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.per_second
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+class RequestScheduler:
+    """Shared request and token budget for one process"""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_queue_time=MAX_QUEUE_TIME, base_delay=1.0, max_delay=60.0):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.max_queue_time = max_queue_time
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """Reserve capacity for one request, or return how long to wait"""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.paused_until - now,
+                       self.requests.wait_time(1, now),
+                       self.tokens.wait_time(tokens, now))
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+            return wait
+
+    def wait_estimate(self, tokens):
+        """How long a request would wait right now, without reserving anything"""
+        with self.lock:
+            now = time.monotonic()
+            return max(self.paused_until - now,
+                       self.requests.wait_time(1, now),
+                       self.tokens.wait_time(tokens, now))
+
+    def next_wait(self, tokens, deadline):
+        wait = self.reserve(tokens)
+        if wait > 0 and time.monotonic() + wait > deadline:
+            raise QueueTimeout(f"Geen plek bij de API binnen {self.max_queue_time:.0f} seconden")
+        # A little jitter keeps waiting callers from waking up in lockstep
+        return wait + random.uniform(0, 0.05) if wait > 0 else 0
+
+    def acquire(self, tokens):
+        """Block until the request may be sent"""
+        deadline = time.monotonic() + self.max_queue_time
+        while True:
+            wait = self.next_wait(tokens, deadline)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens):
+        """Wait without blocking the event loop until the request may be sent"""
+        deadline = time.monotonic() + self.max_queue_time
+        while True:
+            wait = self.next_wait(tokens, deadline)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def backoff(self, attempt, retry_after=None, pause=True):
+        """Delay before the next attempt: Retry-After when the API gave one,
+        otherwise exponential backoff with full jitter. With pause=True all
+        callers of this scheduler hold off for that long."""
+        if retry_after is not None:
+            delay = min(retry_after, self.max_delay)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt + 1)))
+        if pause:
+            with self.lock:
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+def estimate_tokens(messages, max_tokens):
+    """Rough token estimate of a request: ~4 characters per token plus the
+    maximum completion length"""
+    return sum(len(m['content']) for m in messages) // 4 + max_tokens
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, given in seconds or as
+    an HTTP date, or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+def retry_after_seconds(error):
+    """Read Retry-After (or retry-after-ms) from an API error, if present"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    return parse_retry_after(headers.get('retry-after'))
+
+# Shared by all generator instances in this process
+scheduler = RequestScheduler()
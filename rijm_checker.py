@@ -1,12 +1,34 @@
 """
 Dutch rhyming word checker
 """
+from collections import namedtuple
+import heapq
+import os
 import re
+from dutch_g2p import rhyme_key, transcribe
+from rijm_lexicon import load_lexicon
+
+# Bump when the rhyme keys change, compiled lexicons must then be rebuilt
+KEY_VERSION = 3
+
+# Compiled rhyme lexicon, see rijm_lexicon.py
+LEXICON_PATH = os.environ.get(
+    'RIJM_LEXICON',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'rijmwoorden.bin')
+)
+
+# Rhyme schemes like aabb, abab or aaxa
+SCHEME_PATTERN = re.compile(r'[a-zA-Z]+')
 
 def clean_word(word):
     """Remove punctuation and convert to lowercase"""
     return re.sub(r'[^\w\s]', '', word.lower())
 
+def get_last_word(line):
+    """Get the cleaned last word of a poem line"""
+    words = clean_word(line).split()
+    return words[-1] if words else ''
+
 def get_last_syllable(word):
     """Get the last syllable of a word (simplified)"""
     word = clean_word(word)
@@ -18,86 +40,258 @@ def get_last_syllable(word):
     # Include everything from the last vowel onwards
     return word[last_vowel_pos:]
 
-class RhymeChecker:
+# Default Dutch words that are commonly used in Sinterklaas poems, used when
+# no compiled lexicon is available
+DEFAULT_WORDS = [
+    'paard', 'waard', 'taart', 'kaart', 'zwart', 'smart',
+    'nacht', 'wacht', 'zacht', 'bracht', 'verwacht',
+    'dag', 'zag', 'mag', 'lach', 'slag',
+    'veel', 'heel', 'steel', 'kasteel', 'fluweel',
+    'meer', 'keer', 'weer', 'zeer', 'peer',
+    'tijd', 'blijt', 'wijt', 'spijt', 'krijt',
+    'rijk', 'gelijk', 'praktijk', 'muziek', 'publiek',
+    'zing', 'spring', 'ring', 'ding', 'kring',
+    'mooi', 'hooi', 'dooi', 'kooi', 'strooi',
+    'vrouw', 'blauw', 'gauw', 'nauw', 'trouw',
+    'traditie', 'positie', 'ambitie', 'conditie', 'politie',
+    'Sint', 'kind', 'wind', 'lint', 'print',
+    'Piet', 'ziet', 'niet', 'lied', 'verschiet',
+    'boot', 'groot', 'noot', 'rood', 'sloot',
+    'dak', 'pak', 'bak', 'zak', 'tak',
+    'schoen', 'doen', 'zoen', 'groen', 'toen',
+    'huis', 'thuis', 'pluis', 'kruis', 'muis',
+    'blij', 'zij', 'mij', 'vrij', 'voorbij',
+    'feest', 'geweest', 'leest', 'meest', 'beest',
+    'jaar', 'daar', 'klaar', 'zwaar', 'elkaar',
+    'goed', 'moet', 'voet', 'zoet', 'groet',
+    'man', 'kan', 'dan', 'span', 'plan',
+    'klein', 'rein', 'plein', 'fontein', 'terrein',
+    'lach', 'dag', 'zag', 'mag', 'vlag',
+    'spelen', 'delen', 'velen', 'strelen', 'bevelen',
+    'zingen', 'springen', 'dingen', 'kringen', 'dwingen',
+    'leven', 'geven', 'zweven', 'even', 'beleven'
+]
+
+# A rhyming word with its rhyme strength: 1.0 for a perfect rhyme, the
+# fraction of the rhyme that is shared for a half rhyme
+RhymeMatch = namedtuple('RhymeMatch', ['word', 'strength', 'perfect', 'shared'])
+
+class SuffixTrie:
+    """Trie over reversed phonetic transcriptions, so all words sharing an
+    ending are found by one walk from the tail of a word"""
+
     def __init__(self):
-        # Common Dutch word endings that rhyme
-        self.rhyme_patterns = {
-            'aard': ['aard', 'aart', 'ard'],
-            'acht': ['acht', 'agt'],
-            'ag': ['ag', 'ach'],
-            'eel': ['eel', 'eël'],
-            'eer': ['eer', 'air', 'aire'],
-            'eid': ['eid', 'ijt'],
-            'ijk': ['ijk', 'eik'],
-            'ing': ['ing'],
-            'ooi': ['ooi', 'ooie'],
-            'ouw': ['ouw', 'auw'],
-            'tie': ['tie', 'sie', 'cie'],
-        }
+        self.root = {}
+
+    def add(self, suffix, word_id):
+        node = self.root
+        for phoneme in suffix:
+            node = node.setdefault(phoneme, {})
+        node.setdefault(None, []).append(word_id)
+
+    def matches(self, suffix):
+        """Yield (word id, shared length) for all words sharing an ending
+        with the given reversed transcription, longest shared ending first"""
+        path = [self.root]
+        for phoneme in suffix:
+            node = path[-1].get(phoneme)
+            if node is None:
+                break
+            path.append(node)
+
+        # Walk back up, each level only adds the branches not visited yet
+        visited = None
+        for depth in range(len(path) - 1, 0, -1):
+            stack = [path[depth]]
+            while stack:
+                node = stack.pop()
+                for phoneme, child in node.items():
+                    if phoneme is None:
+                        for word_id in child:
+                            yield word_id, depth
+                    elif child is not visited:
+                        stack.append(child)
+            visited = path[depth]
+
+class RhymeChecker:
+    def __init__(self, words=None, lexicon=None):
+        # Large, memory-mapped word list (optional)
+        self.lexicon = lexicon
+
+        # Rhyme index: rhyme key -> bucket of word ids, built once and
+        # kept up to date by add_word()
+        self.words = []
+        self.word_ids = {}
+        self.index = {}
+        self.trie = SuffixTrie()
+        if words is None:
+            words = DEFAULT_WORDS if lexicon is None else []
+        self.add_words(words)
+
+    def get_rhyme_keys(self, word):
+        """Get the rhyme keys of a word: its phonetic rhyme (nucleus plus
+        coda), memoized by dutch_g2p"""
+        key = rhyme_key(clean_word(word).strip())
+        return (key,) if key else ()
+
+    def get_rhyme_suffix(self, word):
+        """Get the reversed phonetic transcription of a word"""
+        return transcribe(clean_word(word).strip())[::-1]
+
+    def add_word(self, word):
+        """Add a word to the rhyme index"""
+        if word in self.word_ids:
+            return
+        keys = self.get_rhyme_keys(word)
+        if not keys:
+            return
+        word_id = len(self.words)
+        self.words.append(word)
+        self.word_ids[word] = word_id
+        for key in keys:
+            self.index.setdefault(key, []).append(word_id)
+        self.trie.add(self.get_rhyme_suffix(word), word_id)
+
+    def add_words(self, words):
+        """Add several words to the rhyme index"""
+        for word in words:
+            self.add_word(word)
 
     def do_words_rhyme(self, word1, word2):
         """Check if two words rhyme"""
-        word1, word2 = clean_word(word1), clean_word(word2)
-        if not word1 or not word2:
-            return False
-            
-        # Exact match of last syllable
-        if get_last_syllable(word1) == get_last_syllable(word2):
-            return True
-            
-        # Check common rhyming patterns
-        for patterns in self.rhyme_patterns.values():
-            if any(word1.endswith(p) for p in patterns) and any(word2.endswith(p) for p in patterns):
-                return True
-                
-        return False
-
-    def get_rhyming_words(self, word, word_list=None):
+        key1 = rhyme_key(clean_word(word1).strip())
+        return bool(key1) and key1 == rhyme_key(clean_word(word2).strip())
+
+    def find_rhymes(self, word, limit=None, min_strength=1.0):
+        """Find rhyming words ranked by rhyme strength, best first.
+
+        Perfect rhymes, words with the same rhyme key, come first, followed
+        by half rhymes that share only part of the rhyme. The walk stops as
+        soon as `limit` matches are found or the strength drops below
+        `min_strength`.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        word = clean_word(word).strip()
+        key = rhyme_key(word)
+        if not key:
+            return []
+        suffix = self.get_rhyme_suffix(word)
+
+        candidates = ((self.words[i], shared) for i, shared in self.trie.matches(suffix))
+        if self.lexicon is not None:
+            lexicon_candidates = ((self.lexicon.word(i), shared)
+                                  for i, shared in self.lexicon.suffix_matches(suffix))
+            candidates = heapq.merge(candidates, lexicon_candidates, key=lambda c: -c[1])
+
+        # Sharing the whole rhyme key is not enough for a perfect rhyme
+        # ('de' and 'lange'), so half rhymes found among them are kept
+        # aside until all perfect rhymes are in
+        perfect_matches = []
+        half_matches = []
+        seen = {word}
+        for test_word, shared in candidates:
+            bound = 1.0 if shared >= len(key) else shared / len(key)
+            if bound < min_strength:
+                break
+            if limit is not None and bound < 1.0 and len(perfect_matches) + len(half_matches) >= limit:
+                break
+            test_key = test_word.lower()
+            if test_key in seen:
+                continue
+            seen.add(test_key)
+            perfect = bound == 1.0 and rhyme_key(clean_word(test_word)) == key
+            strength = 1.0 if perfect else min(bound, 0.99)
+            if strength < min_strength:
+                continue
+            match = RhymeMatch(test_word, round(strength, 2), perfect, shared)
+            (perfect_matches if perfect else half_matches).append(match)
+            if limit is not None and len(perfect_matches) >= limit:
+                break
+        return (perfect_matches + half_matches)[:limit]
+
+    def check_scheme(self, lines, scheme='aabb'):
+        """Check the rhyme scheme of a whole poem in one pass.
+
+        The scheme repeats for every stanza of len(scheme) lines, with new
+        rhymes in every stanza; lines marked 'x' need not rhyme. Empty lines
+        are skipped. Returns a verdict and strength for every pair of
+        consecutive lines that should rhyme with each other. Raises
+        ValueError when the scheme is not a string of letters.
+        """
+        if not isinstance(scheme, str) or not SCHEME_PATTERN.fullmatch(scheme):
+            raise ValueError(f"Ongeldig rijmschema '{scheme}', gebruik letters zoals 'aabb' of 'abab'")
+        scheme = scheme.lower()
+        numbered = [(i, line) for i, line in enumerate(lines) if line.strip()]
+        words = [get_last_word(line) for _, line in numbered]
+        keys = [rhyme_key(word) for word in words]
+        suffixes = [transcribe(word)[::-1] for word in words]
+
+        groups = {}
+        for n in range(len(numbered)):
+            stanza, position = divmod(n, len(scheme))
+            if scheme[position] != 'x':
+                groups.setdefault((stanza, scheme[position]), []).append(n)
+
+        pairs = []
+        for members in groups.values():
+            for a, b in zip(members, members[1:]):
+                perfect = bool(keys[a]) and keys[a] == keys[b]
+                if perfect:
+                    strength = 1.0
+                else:
+                    shared = len(os.path.commonprefix([suffixes[a], suffixes[b]]))
+                    strength = min(shared / len(keys[a]), 0.99) if keys[a] else 0.0
+                pairs.append({
+                    'lines': [numbered[a][0], numbered[b][0]],
+                    'words': [words[a], words[b]],
+                    'rhymes': perfect,
+                    'strength': round(strength, 2)
+                })
+        pairs.sort(key=lambda pair: pair['lines'])
+        return pairs
+
+    def get_rhyming_words(self, word, word_list=None, limit=None, min_strength=1.0):
         """Get list of words that rhyme with the given word"""
-        if word_list is None:
-            # Default Dutch words that are commonly used in Sinterklaas poems
-            word_list = [
-                'paard', 'waard', 'taart', 'kaart', 'zwart', 'smart',
-                'nacht', 'wacht', 'zacht', 'bracht', 'verwacht',
-                'dag', 'zag', 'mag', 'lach', 'slag',
-                'veel', 'heel', 'steel', 'kasteel', 'fluweel',
-                'meer', 'keer', 'weer', 'zeer', 'peer',
-                'tijd', 'blijt', 'wijt', 'spijt', 'krijt',
-                'rijk', 'gelijk', 'praktijk', 'muziek', 'publiek',
-                'zing', 'spring', 'ring', 'ding', 'kring',
-                'mooi', 'hooi', 'dooi', 'kooi', 'strooi',
-                'vrouw', 'blauw', 'gauw', 'nauw', 'trouw',
-                'traditie', 'positie', 'ambitie', 'conditie', 'politie',
-                'Sint', 'kind', 'wind', 'lint', 'print',
-                'Piet', 'ziet', 'niet', 'lied', 'verschiet',
-                'boot', 'groot', 'noot', 'rood', 'sloot',
-                'dak', 'pak', 'bak', 'zak', 'tak',
-                'schoen', 'doen', 'zoen', 'groen', 'toen',
-                'huis', 'thuis', 'pluis', 'kruis', 'muis',
-                'blij', 'zij', 'mij', 'vrij', 'voorbij',
-                'feest', 'geweest', 'leest', 'meest', 'beest',
-                'jaar', 'daar', 'klaar', 'zwaar', 'elkaar',
-                'goed', 'moet', 'voet', 'zoet', 'groet',
-                'man', 'kan', 'dan', 'span', 'plan',
-                'klein', 'rein', 'plein', 'fontein', 'terrein',
-                'lach', 'dag', 'zag', 'mag', 'vlag',
-                'spelen', 'delen', 'velen', 'strelen', 'bevelen',
-                'zingen', 'springen', 'dingen', 'kringen', 'dwingen',
-                'leven', 'geven', 'zweven', 'even', 'beleven'
-            ]
-        
+        if limit is not None and limit <= 0:
+            return []
+        if word_list is not None:
+            # Ad-hoc word lists are not indexed, check them one by one
+            word = clean_word(word)
+            return [w for w in word_list
+                    if w.lower() != word and self.do_words_rhyme(word, w)][:limit]
+
+        if limit is not None or min_strength < 1.0:
+            return [match.word for match in self.find_rhymes(word, limit, min_strength)]
+
         word = clean_word(word)
-        rhyming_words = []
-        
-        for test_word in word_list:
-            if test_word.lower() != word and self.do_words_rhyme(word, test_word):
-                rhyming_words.append(test_word)
-                
+        word_ids = set()
+        for key in self.get_rhyme_keys(word):
+            word_ids.update(self.index.get(key, ()))
+
+        # Keep the order in which the words were added
+        rhyming_words = [self.words[i] for i in sorted(word_ids)
+                         if self.words[i].lower() != word]
+
+        if self.lexicon is not None:
+            seen = {w.lower() for w in rhyming_words}
+            seen.add(word)
+            lexicon_ids = set()
+            for key in self.get_rhyme_keys(word):
+                lexicon_ids.update(self.lexicon.bucket(key))
+            for word_id in sorted(lexicon_ids):
+                test_word = self.lexicon.word(word_id)
+                if test_word.lower() not in seen:
+                    seen.add(test_word.lower())
+                    rhyming_words.append(test_word)
+
         return rhyming_words
 
-# Create a global instance
-rhyme_checker = RhymeChecker()
+# Create a global instance, backed by the compiled lexicon when available
+rhyme_checker = RhymeChecker(lexicon=load_lexicon(LEXICON_PATH, KEY_VERSION))
 
 # Expose methods at module level for backwards compatibility
 do_words_rhyme = rhyme_checker.do_words_rhyme
 get_rhyming_words = rhyme_checker.get_rhyming_words
+find_rhymes = rhyme_checker.find_rhymes
+check_scheme = rhyme_checker.check_scheme
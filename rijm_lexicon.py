@@ -0,0 +1,238 @@
+"""
+Compact on-disk Dutch rhyme lexicon
+
+The lexicon is compiled once from a plain word list (one word per line)
+into a binary file that is memory-mapped at runtime, so every worker
+process shares the same pages instead of parsing text at boot.
+
+File layout (all integers little-endian uint32):
+
+    header          magic, key version, section sizes
+    word offsets    n_words + 1 offsets into the word table
+    word table      sorted utf-8 words
+    key offsets     n_keys + 1 offsets into the key table
+    key table       sorted utf-8 rhyme keys
+    bucket offsets  n_keys + 1 offsets into the bucket ids
+    bucket ids      word ids per rhyme key
+    suffix offsets  n_words + 1 offsets into the suffix table
+    suffix table    sorted reversed phonetic transcriptions
+    suffix ids      word id of every suffix table entry
+
+The suffix table is a flattened reverse-suffix trie: all words sharing
+a phonetic ending form one contiguous range of it.
+
+Build a lexicon with:
+
+    python rijm_lexicon.py woorden.txt -o data/rijmwoorden.bin
+"""
+import argparse
+import bisect
+from itertools import chain
+import mmap
+import os
+import struct
+
+MAGIC = b'RIJMLEX2'
+HEADER = struct.Struct('<8s7I')
+UINT32 = struct.Struct('<I')
+
+def _pad(length):
+    """Number of padding bytes to align a section to 4 bytes"""
+    return -length % 4
+
+class _StringTable:
+    """Sequence view of an offsets + utf-8 data section pair"""
+
+    def __init__(self, mm, offsets, data, count):
+        self.mm = mm
+        self.offsets = offsets
+        self.data = data
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start, = UINT32.unpack_from(self.mm, self.offsets + i * 4)
+        end, = UINT32.unpack_from(self.mm, self.offsets + i * 4 + 4)
+        return self.mm[self.data + start:self.data + end].decode('utf-8')
+
+    def find(self, value):
+        """Binary search for a value, returns its index or None"""
+        i = bisect.bisect_left(self, value)
+        return i if i < self.count and self[i] == value else None
+
+class RhymeLexicon:
+    """Read-only, memory-mapped rhyme lexicon"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self.mm[:len(MAGIC)]
+        if magic != MAGIC or len(self.mm) < HEADER.size:
+            self.mm.close()
+            raise ValueError(f"Onbekend of verouderd lexiconformaat: {path}")
+        (_, self.key_version, self.n_words, self.n_keys, n_bucket_ids,
+         word_data_len, key_data_len, suffix_data_len) = HEADER.unpack_from(self.mm, 0)
+
+        # Section positions follow from the sizes in the header
+        pos = HEADER.size
+        self.words = _StringTable(self.mm, pos, pos + (self.n_words + 1) * 4, self.n_words)
+        pos += (self.n_words + 1) * 4 + word_data_len + _pad(word_data_len)
+        self.keys = _StringTable(self.mm, pos, pos + (self.n_keys + 1) * 4, self.n_keys)
+        pos += (self.n_keys + 1) * 4 + key_data_len + _pad(key_data_len)
+        self.bucket_offsets = pos
+        pos += (self.n_keys + 1) * 4
+        self.bucket_ids = pos
+        pos += n_bucket_ids * 4
+        self.suffixes = _StringTable(self.mm, pos, pos + (self.n_words + 1) * 4, self.n_words)
+        pos += (self.n_words + 1) * 4 + suffix_data_len + _pad(suffix_data_len)
+        self.suffix_ids = pos
+        pos += self.n_words * 4
+
+        if len(self.mm) != pos:
+            self.mm.close()
+            raise ValueError(f"Beschadigd rijmlexicon, {len(self.mm)} bytes in plaats van {pos}: {path}")
+
+    def __len__(self):
+        return self.n_words
+
+    def __iter__(self):
+        return (self.words[i] for i in range(self.n_words))
+
+    def __contains__(self, word):
+        return self.words.find(word) is not None
+
+    def _uint32(self, section, i):
+        return UINT32.unpack_from(self.mm, section + i * 4)[0]
+
+    def word(self, i):
+        """Get the word with the given id"""
+        return self.words[i]
+
+    def bucket(self, key):
+        """Get the ids of all words with the given rhyme key"""
+        key_id = self.keys.find(key)
+        if key_id is None:
+            return []
+        start = self._uint32(self.bucket_offsets, key_id)
+        end = self._uint32(self.bucket_offsets, key_id + 1)
+        return [self._uint32(self.bucket_ids, i) for i in range(start, end)]
+
+    def suffix_matches(self, suffix):
+        """Yield (word id, shared length) for all words sharing an ending
+        with the given reversed transcription, longest shared ending first"""
+        # Narrow the range one phoneme at a time, like walking down a trie
+        ranges = [(0, self.n_words)]
+        for depth in range(1, len(suffix) + 1):
+            prefix = suffix[:depth]
+            lo, hi = ranges[-1]
+            lo = bisect.bisect_left(self.suffixes, prefix, lo, hi)
+            hi = bisect.bisect_left(self.suffixes, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo, hi)
+            if lo == hi:
+                break
+            ranges.append((lo, hi))
+
+        # Walk back up, each level only adds the entries outside the deeper range
+        inner_lo = inner_hi = None
+        for depth in range(len(ranges) - 1, 0, -1):
+            lo, hi = ranges[depth]
+            if inner_lo is None:
+                inner_lo = inner_hi = hi
+            for i in chain(range(lo, inner_lo), range(inner_hi, hi)):
+                yield self._uint32(self.suffix_ids, i), depth
+            inner_lo, inner_hi = lo, hi
+
+    def close(self):
+        self.mm.close()
+
+def read_word_list(path):
+    """Read a plain text word list, one word per line"""
+    words = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            word = line.strip()
+            if word and not word.startswith('#'):
+                words.add(word)
+    return sorted(words)
+
+def build_lexicon(words, output_path, get_rhyme_keys, get_suffix, key_version):
+    """Compile a list of words into the binary lexicon format"""
+    words = sorted(set(words))
+    buckets = {}
+    for word_id, word in enumerate(words):
+        for key in get_rhyme_keys(word):
+            buckets.setdefault(key, []).append(word_id)
+    keys = sorted(buckets)
+    suffixes = sorted((get_suffix(word), word_id) for word_id, word in enumerate(words))
+
+    def string_table(strings):
+        offsets, data = [0], bytearray()
+        for s in strings:
+            data += s.encode('utf-8')
+            offsets.append(len(data))
+        return offsets, bytes(data)
+
+    word_offsets, word_data = string_table(words)
+    key_offsets, key_data = string_table(keys)
+    suffix_offsets, suffix_data = string_table(s for s, _ in suffixes)
+    bucket_offsets, bucket_ids = [0], []
+    for key in keys:
+        bucket_ids.extend(buckets[key])
+        bucket_offsets.append(len(bucket_ids))
+
+    def uint32s(values):
+        return struct.pack(f'<{len(values)}I', *values)
+
+    # Write to a temporary file first, running workers keep their mapping
+    # of the old file until they reload
+    tmp_path = output_path + '.tmp'
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, key_version, len(words), len(keys), len(bucket_ids),
+                            len(word_data), len(key_data), len(suffix_data)))
+        f.write(uint32s(word_offsets))
+        f.write(word_data + b'\0' * _pad(len(word_data)))
+        f.write(uint32s(key_offsets))
+        f.write(key_data + b'\0' * _pad(len(key_data)))
+        f.write(uint32s(bucket_offsets))
+        f.write(uint32s(bucket_ids))
+        f.write(uint32s(suffix_offsets))
+        f.write(suffix_data + b'\0' * _pad(len(suffix_data)))
+        f.write(uint32s([word_id for _, word_id in suffixes]))
+    os.replace(tmp_path, output_path)
+    return len(words), len(keys)
+
+def load_lexicon(path, key_version):
+    """Load a compiled lexicon, or None if it is missing or outdated"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        lexicon = RhymeLexicon(path)
+    except (OSError, ValueError) as e:
+        print(f"Kon rijmlexicon niet laden: {str(e)}")
+        return None
+    if lexicon.key_version != key_version:
+        print(f"Rijmlexicon {path} is verouderd, bouw het opnieuw met rijm_lexicon.py")
+        lexicon.close()
+        return None
+    return lexicon
+
+def main():
+    from rijm_checker import KEY_VERSION, LEXICON_PATH, RhymeChecker
+
+    parser = argparse.ArgumentParser(description="Compileer een Nederlandse woordenlijst naar een rijmlexicon")
+    parser.add_argument('words', help="Tekstbestand met één woord per regel")
+    parser.add_argument('-o', '--output', default=LEXICON_PATH, help="Pad van het gecompileerde lexicon")
+    args = parser.parse_args()
+
+    checker = RhymeChecker(words=[], lexicon=None)
+    n_words, n_keys = build_lexicon(read_word_list(args.words), args.output,
+                                    checker.get_rhyme_keys, checker.get_rhyme_suffix,
+                                    KEY_VERSION)
+    print(f"Rijmlexicon gebouwd: {n_words} woorden, {n_keys} rijmsleutels -> {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Concurrent crawler for the Sinterklaas poem corpus
+
+Starting from the scraper's base URL, the crawler follows links to
+category and pagination pages on the same site and adds the poems of
+every page to the local corpus. Pages are fetched and parsed on a
+bounded thread pool, each thread with its own pooled HTTP session, so
+crawl time grows with pages / workers instead of pages x latency.
+
+It stays polite: at most a few requests per host at a time with a
+minimum interval between them, retries with backoff on errors, and
+conditional requests for pages it has seen before. Pages found in an
+earlier crawl are visited again even when the page linking to them has
+not changed.
+
+Run a crawl with:
+
+    python sint_crawler.py --workers 8
+"""
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import re
+import threading
+import time
+from urllib.parse import urldefrag, urljoin, urlparse
+from bs4 import BeautifulSoup
+import requests
+from rate_limiter import parse_retry_after
+from sint_scraper import SinterklaasGedichtenScraper, poems_from_soup
+
+# Links worth following: poem and category pages, and pagination
+LINK_PATTERN = r'gedicht|/page/\d+'
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# A crawl holds this lease in the corpus database, so processes do not crawl at the same time
+CRAWL_LEASE = 'crawl'
+CRAWL_LEASE_SECONDS = 15 * 60
+
+class HostLimiter:
+    """At most `per_host` requests in flight and `min_interval` seconds
+    between request starts, per host"""
+
+    def __init__(self, per_host=4, min_interval=0.1):
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.next_start = {}
+
+    def semaphore(self, host):
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self.semaphores[host]
+
+    def wait_turn(self, host):
+        """Reserve the next start slot of a host and sleep until it"""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+class CrawlStats:
+    def __init__(self):
+        self.fetched = 0
+        self.not_modified = 0
+        self.failed = 0
+        self.poems_added = 0
+        self.seconds = 0.0
+
+class SinterklaasCrawler:
+    """Crawl the poem site into the scraper's corpus"""
+
+    def __init__(self, scraper=None, base_url=None, workers=8, per_host=4, min_interval=0.1,
+                 max_pages=200, retries=3, timeout=10, link_pattern=LINK_PATTERN):
+        self.scraper = scraper or SinterklaasGedichtenScraper()
+        self.corpus = self.scraper.corpus
+        self.base_url = base_url or self.scraper.base_url
+        self.workers = workers
+        self.limiter = HostLimiter(per_host, min_interval)
+        self.max_pages = max_pages
+        self.retries = retries
+        self.timeout = timeout
+        self.link_pattern = re.compile(link_pattern)
+        self.host = urlparse(self.base_url).netloc
+        self.local = threading.local()
+
+    def session(self):
+        """The HTTP session of the current thread, which keeps its connections open"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; rijmelarij)'
+        return session
+
+    def get(self, url, headers):
+        """GET with a per-host limit and retries with exponential backoff"""
+        host = urlparse(url).netloc
+        for attempt in range(self.retries + 1):
+            with self.limiter.semaphore(host):
+                self.limiter.wait_turn(host)
+                try:
+                    response = self.session().get(url, headers=headers, timeout=self.timeout)
+                except requests.RequestException:
+                    if attempt == self.retries:
+                        raise
+                    response = None
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            if response is not None and attempt == self.retries:
+                response.raise_for_status()
+            delay = 0.5 * 2 ** attempt
+            retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+            if retry_after is not None:
+                delay = min(retry_after, 30)
+            time.sleep(delay)
+
+    def links(self, soup, url):
+        """Links on a page to other pages worth crawling on the same site"""
+        found = []
+        for a in soup.find_all('a', href=True):
+            link = urldefrag(urljoin(url, a['href']))[0]
+            parsed = urlparse(link)
+            if parsed.scheme in ('http', 'https') and parsed.netloc == self.host \
+                    and self.link_pattern.search(parsed.path):
+                found.append(link)
+        return found
+
+    def fetch_page(self, url):
+        """Fetch and parse one page, returns (new poems, links), runs on the pool"""
+        headers = {}
+        page = self.corpus.page(url)
+        if page is not None:
+            etag, last_modified, _ = page
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        response = self.get(url, headers)
+        if response.status_code == 304:
+            self.corpus.save_page(url)
+            return None, []
+        response.raise_for_status()
+
+        soup = BeautifulSoup(response.text, 'html.parser')
+        fetched_at = time.time()
+        added = self.corpus.add_poems(poems_from_soup(soup), source_url=url, fetched_at=fetched_at)
+        self.corpus.save_page(url, etag=response.headers.get('ETag'),
+                              last_modified=response.headers.get('Last-Modified'), fetched_at=fetched_at)
+        return added, self.links(soup, url)
+
+    def crawl(self):
+        """Crawl from the base URL and pages known from earlier crawls.
+        Returns None without crawling if another process is crawling."""
+        holder = self.corpus.acquire_lease(CRAWL_LEASE, CRAWL_LEASE_SECONDS)
+        if holder is None:
+            print("Het corpus wordt al door een ander proces ververst")
+            return None
+        try:
+            return self.crawl_pages()
+        finally:
+            self.corpus.release_lease(CRAWL_LEASE, holder)
+
+    def crawl_pages(self):
+        stats = CrawlStats()
+        start = time.monotonic()
+        seeds = [self.base_url] + [url for url in self.corpus.page_urls()
+                                   if urlparse(url).netloc == self.host and url != self.base_url]
+        seen = set(seeds[:self.max_pages])
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='crawler') as pool:
+            pending = {pool.submit(self.fetch_page, url): url for url in seeds[:self.max_pages]}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        added, links = future.result()
+                    except Exception as e:
+                        print(f"Fout bij het ophalen van {url}: {str(e)}")
+                        stats.failed += 1
+                        continue
+                    if added is None:
+                        stats.not_modified += 1
+                    else:
+                        stats.fetched += 1
+                        stats.poems_added += added
+                    for link in links:
+                        if link not in seen and len(seen) < self.max_pages:
+                            seen.add(link)
+                            pending[pool.submit(self.fetch_page, link)] = link
+
+        stats.seconds = round(time.monotonic() - start, 3)
+        print(f"Crawl klaar: {stats.fetched} pagina's opgehaald, {stats.not_modified} ongewijzigd, "
+              f"{stats.failed} mislukt, {stats.poems_added} nieuwe gedichten in {stats.seconds}s")
+        return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Vul het lokale corpus met Sinterklaasgedichten")
+    parser.add_argument('--base-url', help="Startpagina van de crawl")
+    parser.add_argument('--workers', type=int, default=8, help="Aantal pagina's tegelijk")
+    parser.add_argument('--per-host', type=int, default=4, help="Maximaal aantal verzoeken tegelijk per host")
+    parser.add_argument('--max-pages', type=int, default=200, help="Maximaal aantal pagina's")
+    args = parser.parse_args()
+
+    crawler = SinterklaasCrawler(base_url=args.base_url, workers=args.workers,
+                                 per_host=args.per_host, max_pages=args.max_pages)
+    crawler.crawl()
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,52 @@
+import os
 import requests
 from bs4 import BeautifulSoup
 import random
 import re
+import time
+from lazy_resource import LazyResource
+from poem_corpus import PoemCorpus
+
+# How old the local corpus may get before the site is asked for changes
+REFRESH_INTERVAL = float(os.environ.get('RIJM_CORPUS_REFRESH', 24 * 3600))
+
+def clean_poem(poem):
+    """Maak het gedicht schoon van onnodige tekens en opmaak"""
+    # Verwijder HTML tags
+    poem = re.sub(r'<[^>]+>', '', poem)
+    # Verwijder dubbele witregels
+    poem = re.sub(r'\n\s*\n', '\n', poem)
+    # Verwijder spaties aan begin en eind van regels
+    poem = '\n'.join(line.strip() for line in poem.split('\n'))
+    return poem
+
+def parse_poems(html):
+    """Haal de gedichten uit de HTML van een pagina, zonder netwerk"""
+    return poems_from_soup(BeautifulSoup(html, 'html.parser'))
+
+def poems_from_soup(soup):
+    """Haal de gedichten uit een geparste pagina"""
+    # Zoek alle gedichten op de pagina
+    # Dit moet aangepast worden op basis van de HTML structuur van de website
+    poem_elements = soup.find_all(['p', 'div'], class_=['poem', 'gedicht'])
+    
+    poems = []
+    for element in poem_elements:
+        poem_text = element.get_text().strip()
+        if poem_text and len(poem_text.split('\n')) > 2:  # Minimaal 2 regels
+            poems.append(clean_poem(poem_text))
+    return poems
+
+BASE_URL = os.environ.get('RIJM_CORPUS_URL', "https://sinterklaasgedichten.com/kant-en-klare-sinterklaasgedichten")
 
 class SinterklaasGedichtenScraper:
-    def __init__(self):
-        self.base_url = "https://sinterklaasgedichten.com/kant-en-klare-sinterklaasgedichten"
+    def __init__(self, corpus=None, base_url=BASE_URL):
+        self.base_url = base_url
         self.poems = []
+        self.corpus = corpus or PoemCorpus()
+        self.session = requests.Session()
+        # Scrapen gebeurt pas bij het eerste gebruik of in een warm-up thread
+        self.loader = LazyResource('gedichten', self.scrape_poems)
         self.common_sint_phrases = [
             "Zie ginds komt de stoomboot",
             "Sinterklaas kapoentje",
@@ -30,36 +70,52 @@ class SinterklaasGedichtenScraper:
         ]
 
     def scrape_poems(self):
-        """Scrape Sinterklaasgedichten from the website"""
+        """Laad de gedichten uit het lokale corpus, ververst als het verouderd is"""
         try:
-            response = requests.get(self.base_url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Zoek alle gedichten op de pagina
-            # Dit moet aangepast worden op basis van de HTML structuur van de website
-            poem_elements = soup.find_all(['p', 'div'], class_=['poem', 'gedicht'])
-            
-            for element in poem_elements:
-                poem_text = element.get_text().strip()
-                if poem_text and len(poem_text.split('\n')) > 2:  # Minimaal 2 regels
-                    self.poems.append(self.clean_poem(poem_text))
-            
-            print(f"Aantal gedichten verzameld: {len(self.poems)}")
+            page = self.corpus.page(self.base_url)
+            if page is None or time.time() - page[2] > REFRESH_INTERVAL:
+                from sint_crawler import SinterklaasCrawler
+                SinterklaasCrawler(self).crawl()
         except Exception as e:
             print(f"Fout bij het scrapen van gedichten: {str(e)}")
+        
+        self.poems = self.corpus.poems()
+        print(f"Aantal gedichten verzameld: {len(self.poems)}")
+        if not self.poems:
             # Gebruik backup zinnen als scrapen mislukt
             self.poems = self.get_backup_phrases()
 
+    def refresh(self, url=None):
+        """Haal een pagina opnieuw op als die veranderd is, geeft het aantal nieuwe gedichten"""
+        url = url or self.base_url
+        headers = {}
+        page = self.corpus.page(url)
+        if page is not None:
+            etag, last_modified, _ = page
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        
+        response = self.session.get(url, headers=headers, timeout=10)
+        if response.status_code == 304:
+            self.corpus.save_page(url)
+            return 0
+        response.raise_for_status()
+        return self.ingest(response.text, url,
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
+
+    def ingest(self, html, url, etag=None, last_modified=None):
+        """Voeg de gedichten van een opgehaalde (of opgeslagen) pagina toe aan het corpus"""
+        fetched_at = time.time()
+        added = self.corpus.add_poems(parse_poems(html), source_url=url, fetched_at=fetched_at)
+        self.corpus.save_page(url, etag=etag, last_modified=last_modified, fetched_at=fetched_at)
+        return added
+
     def clean_poem(self, poem):
         """Maak het gedicht schoon van onnodige tekens en opmaak"""
-        # Verwijder HTML tags
-        poem = re.sub(r'<[^>]+>', '', poem)
-        # Verwijder dubbele witregels
-        poem = re.sub(r'\n\s*\n', '\n', poem)
-        # Verwijder spaties aan begin en eind van regels
-        poem = '\n'.join(line.strip() for line in poem.split('\n'))
-        return poem
+        return clean_poem(poem)
 
     def get_backup_phrases(self):
         """Geef backup Sinterklaas zinnen terug als scrapen mislukt"""
@@ -76,8 +132,7 @@ class SinterklaasGedichtenScraper:
 
     def get_random_poem(self):
         """Geef een willekeurig gedicht terug"""
-        if not self.poems:
-            self.scrape_poems()
+        self.loader.get()
         return random.choice(self.poems) if self.poems else self.get_random_sint_phrase()
 
     def get_sint_context(self):
@@ -0,0 +1,44 @@
+"""
+Local storage of the application
+
+All files the application writes (databases, saved poems, PDFs, caches)
+go under STORAGE_DIR: next to the code, or /tmp on Vercel where nothing
+else is writable. The SQLite stores share the way they connect: one
+connection per thread, in WAL mode so all workers on the machine can
+read while one writes.
+"""
+import os
+import sqlite3
+import threading
+
+ON_VERCEL = bool(os.environ.get('VERCEL'))
+
+# For Vercel deployment - use /tmp for file storage
+STORAGE_DIR = '/tmp' if ON_VERCEL else os.path.dirname(os.path.abspath(__file__))
+
+def storage_path(*parts):
+    """Path of a file or directory under STORAGE_DIR"""
+    return os.path.join(STORAGE_DIR, *parts)
+
+class ThreadConnections:
+    """One SQLite connection per thread to a database file, created on first
+    use. `setup(conn)` runs once per connection, to create tables."""
+
+    def __init__(self, path, setup=None, timeout=10, isolation_level=''):
+        self.path = path
+        self.setup = setup
+        self.timeout = timeout
+        # '' is sqlite3's default (implicit transactions), None is autocommit
+        self.isolation_level = isolation_level
+        self.local = threading.local()
+
+    def get(self):
+        """Get the connection of the current thread"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=self.isolation_level)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+            if self.setup is not None:
+                self.setup(conn)
+        return conn
@@ -0,0 +1,36 @@
+import importlib
+import pytest
+import storage
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    # The app creates its directories at import, keep them out of the repository
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(storage, 'STORAGE_DIR', str(tmp_path_factory.mktemp('storage')))
+        monkeypatch.setenv('RIJM_WARM_UP', '0')
+        app = importlib.import_module('app')
+        yield app.app.test_client()
+
+def test_get_rhyming_words(client):
+    response = client.post('/get_rhyming_words', json={'word': 'kat', 'limit': 5, 'min_strength': 0.5})
+
+    assert response.status_code == 200
+    assert len(response.get_json()['rhyming_words']) <= 5
+
+@pytest.mark.parametrize('data', [
+    {'word': 'kat', 'limit': None},
+    {'word': 'kat', 'limit': 'abc'},
+    {'word': 'kat', 'limit': 2.5},
+    {'word': 'kat', 'limit': -1},
+    {'word': 'kat', 'limit': 100000},
+    {'word': 'kat', 'min_strength': None},
+    {'word': 'kat', 'min_strength': 'veel'},
+    {'word': 'kat', 'min_strength': 1.5},
+    {'word': 'kat', 'min_strength': -0.1},
+    {'word': 42},
+])
+def test_get_rhyming_words_rejects_invalid_input(client, data):
+    response = client.post('/get_rhyming_words', json=data)
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
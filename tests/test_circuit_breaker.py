@@ -0,0 +1,116 @@
+import httpx
+from openai import RateLimitError
+import pytest
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+class Clock:
+    """A clock that only moves when the test says so"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_breaker(clock):
+    return CircuitBreaker('test', window=10, min_calls=4, failure_rate=0.5, slow_call_seconds=5,
+                          slow_call_rate=0.75, open_seconds=30, clock=clock)
+
+def succeed(breaker, clock, seconds=0):
+    with breaker.call(ignore=(RateLimitError,)):
+        clock.now += seconds
+
+def fail(breaker, clock, error=None, seconds=0):
+    with pytest.raises(type(error) if error else RuntimeError):
+        with breaker.call(ignore=(RateLimitError,)):
+            clock.now += seconds
+            raise error or RuntimeError("API fout")
+
+def rate_limit_error():
+    response = httpx.Response(429, request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+    return RateLimitError("Rate limit", response=response, body=None)
+
+def test_opens_on_failure_rate():
+    clock = Clock()
+    breaker = make_breaker(clock)
+    succeed(breaker, clock)
+    succeed(breaker, clock)
+    fail(breaker, clock)
+    assert breaker.state == CLOSED
+
+    fail(breaker, clock)  # 2 of 4
+    assert breaker.state == OPEN
+    assert not breaker.available()
+    with pytest.raises(CircuitOpen):
+        succeed(breaker, clock)
+    assert breaker.status()['rejected'] == 1
+
+def test_waits_for_min_calls():
+    clock = Clock()
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        fail(breaker, clock)
+    assert breaker.state == CLOSED
+
+def test_opens_on_slow_call_rate():
+    clock = Clock()
+    breaker = make_breaker(clock)
+    succeed(breaker, clock, seconds=1)
+    for _ in range(2):
+        succeed(breaker, clock, seconds=5)
+    assert breaker.state == CLOSED
+
+    succeed(breaker, clock, seconds=6)  # 3 of 4 slow
+    assert breaker.state == OPEN
+
+def test_half_open_lets_one_trial_call_through():
+    clock = Clock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        fail(breaker, clock)
+    assert breaker.state == OPEN
+
+    clock.now += 29
+    assert not breaker.available()
+    clock.now += 1
+    assert breaker.available()
+
+    with breaker.call():
+        assert breaker.state == HALF_OPEN
+        # A second call during the trial is refused
+        assert not breaker.available()
+        with pytest.raises(CircuitOpen):
+            succeed(breaker, clock)
+    assert breaker.state == CLOSED
+    assert breaker.status()['calls'] == 0
+
+def test_failed_trial_call_opens_again():
+    clock = Clock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        fail(breaker, clock)
+    clock.now += 30
+
+    fail(breaker, clock)
+    assert breaker.state == OPEN
+    assert breaker.status()['retry_in'] == 30
+    assert breaker.status()['times_opened'] == 2
+
+def test_slow_trial_call_opens_again():
+    clock = Clock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        fail(breaker, clock)
+    clock.now += 30
+
+    succeed(breaker, clock, seconds=5)
+    assert breaker.state == OPEN
+
+def test_rate_limit_is_not_a_failure():
+    clock = Clock()
+    breaker = make_breaker(clock)
+    for _ in range(10):
+        fail(breaker, clock, error=rate_limit_error())
+
+    assert breaker.state == CLOSED
+    assert breaker.status()['failure_rate'] == 0.0
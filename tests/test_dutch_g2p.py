@@ -0,0 +1,57 @@
+import pytest
+from dutch_g2p import rhyme_key
+
+RHYMES = [
+    ('dag', 'lach'),
+    ('fiets', 'niets'),
+    ('tijd', 'meid'),
+    ('huis', 'muis'),
+    ('vrouw', 'blauw'),
+    ('hond', 'mond'),
+    ('lezen', 'wezen'),
+    ('spelen', 'delen'),
+    ('gelijk', 'rijk'),
+    ('militair', 'meer'),
+    ('positie', 'traditie'),
+    ('politie', 'ambitie'),
+    ('natie', 'informatie'),
+    ('actie', 'fractie'),
+    ('vakantie', 'garantie'),
+    ('visie', 'televisie'),
+    ('versie', 'conversie'),
+    ('democratie', 'zie'),
+    ('fantasie', 'knie'),
+]
+
+NON_RHYMES = [
+    ('dag', 'dak'),
+    ('kat', 'kaart'),
+    ('pit', 'piet'),
+    ('put', 'puur'),
+    ('de', 'lange'),
+    ('positie', 'zie'),
+    ('natie', 'drie'),
+    ('televisie', 'zie'),
+    ('versie', 'knie'),
+    ('actie', 'natie'),
+    ('positie', 'natie'),
+]
+
+@pytest.mark.parametrize('word1, word2', RHYMES)
+def test_rhymes(word1, word2):
+    assert rhyme_key(word1) == rhyme_key(word2)
+
+@pytest.mark.parametrize('word1, word2', NON_RHYMES)
+def test_non_rhymes(word1, word2):
+    assert rhyme_key(word1) != rhyme_key(word2)
+
+@pytest.mark.parametrize('word, key', [
+    ('dag', 'Ax'),
+    ('fiets', 'its'),
+    ('positie', 'itsi'),
+    ('actie', 'Aksi'),
+    ('discussie', '}si'),
+    ('zie', 'i'),
+])
+def test_rhyme_key(word, key):
+    assert rhyme_key(word) == key
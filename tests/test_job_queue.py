@@ -0,0 +1,70 @@
+import time
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+def make_queue(tmp_path, **options):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), workers=0, **options)
+
+def expire_lease(queue, job_id):
+    queue.connect().execute('UPDATE jobs SET lease_until = ? WHERE id = ?', (time.time() - 1, job_id))
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=3)
+    job_id = queue.enqueue('render', {})
+    assert queue.claim()['id'] == job_id
+    expire_lease(queue, job_id)
+
+    assert queue.claim()['id'] == job_id
+    assert queue.get(job_id)['attempts'] == 2
+
+def test_expired_lease_on_last_attempt_fails(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=2)
+    job_id = queue.enqueue('render', {})
+    for _ in range(2):
+        # The worker dies while running the job
+        assert queue.claim()['id'] == job_id
+        assert queue.get(job_id)['status'] == RUNNING
+        expire_lease(queue, job_id)
+
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert job['status'] == FAILED
+    assert job['attempts'] == 2
+
+def test_failing_job_is_retried_until_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=3)
+    calls = []
+
+    def handler(payload):
+        calls.append(payload)
+        raise RuntimeError('kapot')
+
+    queue.register('render', handler)
+    job_id = queue.enqueue('render', {'n': 1})
+    while queue.run_one():
+        pass
+
+    assert len(calls) == 3
+    assert queue.get(job_id)['status'] == FAILED
+    assert queue.get(job_id)['error'] == 'kapot'
+
+def test_inline_queue_runs_the_job_in_enqueue(tmp_path):
+    queue = make_queue(tmp_path, inline=True)
+    attempts = []
+
+    def handler(payload):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            raise RuntimeError('even niet')
+        return {'pdf_path': payload['pdf_filename']}
+
+    queue.register('render', handler)
+    other = JobQueue(queue.path, workers=0).enqueue('render', {'pdf_filename': 'ander.pdf'})
+    job_id = queue.enqueue('render', {'pdf_filename': 'gedicht.pdf'})
+
+    job = queue.get(job_id)
+    assert job['status'] == DONE
+    assert job['result'] == {'pdf_path': 'gedicht.pdf'}
+    assert attempts == [{'pdf_filename': 'gedicht.pdf'}] * 2
+    # Only the enqueued job runs inline, not older ones
+    assert queue.get(other)['status'] == QUEUED
+    assert queue.workers == 0
@@ -0,0 +1,56 @@
+from llm_cache import MemoryCache, SQLiteCache, make_cache_key
+from tiered_cache import TieredCache
+
+def accessed_at(cache, key):
+    return cache.connect().execute('SELECT accessed_at FROM llm_cache WHERE key = ?', (key,)).fetchone()[0]
+
+def test_hits_do_not_write(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    cache.set('a', 'antwoord')
+    written = accessed_at(cache, 'a')
+    changes = cache.connect().total_changes
+
+    for _ in range(10):
+        assert cache.get('a') == 'antwoord'
+
+    assert cache.connect().total_changes == changes
+    assert accessed_at(cache, 'a') == written
+
+def test_access_times_are_written_with_the_next_set(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    cache.set('a', 'antwoord')
+    written = accessed_at(cache, 'a')
+    cache.get('a')
+
+    cache.set('b', 'ander antwoord')
+
+    assert accessed_at(cache, 'a') > written
+
+def test_access_times_are_written_in_batches(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'), touch_batch=3)
+    for key in 'abc':
+        cache.set(key, key)
+    written = {key: accessed_at(cache, key) for key in 'abc'}
+
+    cache.get('a')
+    cache.get('b')
+    assert accessed_at(cache, 'a') == written['a']
+    cache.get('c')
+
+    assert all(accessed_at(cache, key) > written[key] for key in 'abc')
+
+def test_memory_tier_in_front(tmp_path):
+    sqlite_tier = SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    sqlite_tier.set('a', 'antwoord')
+    cache = TieredCache([MemoryCache(), sqlite_tier])
+
+    assert cache.get('a') == 'antwoord'
+    assert cache.tiers[0].get('a') == 'antwoord'
+    assert cache.get('b') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_cache_key_ignores_whitespace():
+    messages = [{'role': 'user', 'content': 'Rijm op  dag'}]
+    reformatted = [{'role': 'user', 'content': 'Rijm op\n dag '}]
+    assert make_cache_key('m', messages, 0, 50) == make_cache_key('m', reformatted, 0, 50)
+    assert make_cache_key('m', messages, 0, 50) != make_cache_key('m', messages, 0.7, 50)
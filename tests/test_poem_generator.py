@@ -0,0 +1,114 @@
+import json
+import circuit_breaker
+import poem_generator
+from lazy_resource import LazyResource
+from poem_generator import PoemGenerator
+from prompts import BATCH_ANSWER, batch_prompt, person_block, user_prompt
+
+class ExampleIndex:
+    """Stand-in for the BM25 index, one example per query"""
+
+    def top_k(self, query, k):
+        return [f"Voorbeeld over {query}\nmet een tweede regel"]
+
+def make_generator(index=None):
+    generator = PoemGenerator()
+    generator.poem_index = LazyResource('voorbeeldindex', lambda: index)
+    if index is not None:
+        generator.poem_index.get()
+    return generator
+
+CONTEXTS = [
+    {'name': 'Tim', 'gender': 'jongen', 'gift': 'fiets', 'hobbies': 'voetbal', 'is_surprise': True},
+    {'name': 'Anna', 'gender': 'vrouw', 'gift': 'boek', 'hobbies': 'lezen', 'is_surprise': False},
+]
+
+def test_batch_prompt_has_the_examples_of_every_person():
+    generator = make_generator(ExampleIndex())
+    content = generator.batch_messages(CONTEXTS)[1]['content']
+
+    for context in CONTEXTS:
+        for example in generator.example_couplets(context):
+            assert example in content
+    assert content.count('Voorbeelden van de gewenste toon') == 2
+
+def test_batch_prompt_without_index_has_no_examples():
+    generator = make_generator()
+    content = generator.batch_messages(CONTEXTS)[1]['content']
+
+    assert 'Voorbeelden' not in content
+    assert 'Persoon 2:' in content
+
+def test_batch_prompt_follows_the_prompt_variant():
+    for variant in ('full', 'compact'):
+        content = batch_prompt(CONTEXTS, [[], []], variant)
+        for number, context in enumerate(CONTEXTS, 1):
+            assert person_block(context, variant, number) in content
+        assert content.endswith(BATCH_ANSWER[variant])
+
+    full = batch_prompt(CONTEXTS, [[], []], 'full')
+    compact = batch_prompt(CONTEXTS, [[], []], 'compact')
+    assert len(compact) < len(full) * 0.6
+
+def test_batch_prompt_shares_the_person_block_with_single_poems():
+    context = CONTEXTS[0]
+    for variant in ('full', 'compact'):
+        assert person_block(context, variant) in user_prompt(context, variant=variant)
+
+def test_parse_batch():
+    generator = make_generator()
+    response = json.dumps({'gedichten': [{'persoon': 2, 'regels': ['Regel een', 'Regel twee']}]})
+
+    assert generator.parse_batch(response, 2) == [None, ['Regel een', 'Regel twee']]
+    assert generator.parse_batch('geen json', 2) == [None, None]
+
+class FakeStream:
+    """A streamed completion that breaks off after its chunks"""
+
+    def __init__(self, parts, error=None):
+        self.parts = parts
+        self.error = error
+        self.response = self
+        self.closed = False
+
+    def __iter__(self):
+        for part in self.parts:
+            delta = type('Delta', (), {'content': part})
+            yield type('Chunk', (), {'choices': [type('Choice', (), {'delta': delta})]})
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+def stream_generator(monkeypatch, stream):
+    breaker = circuit_breaker.CircuitBreaker('test')
+    client = type('Client', (), {})()
+    client.chat = type('Chat', (), {})()
+    client.chat.completions = type('Completions', (), {'create': lambda self, **kwargs: stream})()
+    monkeypatch.setattr(poem_generator, 'openai_breaker', breaker)
+    monkeypatch.setattr(poem_generator, 'get_client', lambda: client)
+    monkeypatch.setattr(poem_generator.scheduler, 'acquire', lambda tokens: None)
+    generator = make_generator()
+    monkeypatch.setattr(generator, 'use_local', lambda context: False)
+    return generator, breaker
+
+def test_stream_that_breaks_off_counts_as_a_failure(monkeypatch):
+    stream = FakeStream(['Eerste regel\n', 'Tweede'], error=TimeoutError("read timeout"))
+    generator, breaker = stream_generator(monkeypatch, stream)
+
+    lines = list(generator.generate_poem_stream(CONTEXTS[0]))
+
+    assert lines == ['Eerste regel']
+    assert list(breaker.calls) == [(True, False)]
+    assert stream.closed
+
+def test_client_leaving_a_stream_is_not_a_failure(monkeypatch):
+    stream = FakeStream(['Eerste regel\n', 'Tweede regel\n'])
+    generator, breaker = stream_generator(monkeypatch, stream)
+
+    lines = generator.generate_poem_stream(CONTEXTS[0])
+    assert next(lines) == 'Eerste regel'
+    lines.close()
+
+    assert list(breaker.calls) == [(False, False)]
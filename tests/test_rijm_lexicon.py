@@ -0,0 +1,46 @@
+import pytest
+from rijm_checker import DEFAULT_WORDS, KEY_VERSION, RhymeChecker
+from rijm_lexicon import build_lexicon, load_lexicon
+
+@pytest.fixture
+def checker():
+    return RhymeChecker(words=DEFAULT_WORDS)
+
+@pytest.fixture
+def lexicon_path(tmp_path, checker):
+    path = str(tmp_path / 'rijmwoorden.bin')
+    build_lexicon(checker.words, path, checker.get_rhyme_keys, checker.get_rhyme_suffix, KEY_VERSION)
+    return path
+
+def test_lexicon_matches_the_in_memory_index(checker, lexicon_path):
+    lexicon = load_lexicon(lexicon_path, KEY_VERSION)
+    assert lexicon is not None
+    assert sorted(lexicon) == sorted(checker.words)
+
+    for key, word_ids in checker.index.items():
+        assert sorted(lexicon.word(i) for i in lexicon.bucket(key)) == sorted(checker.words[i] for i in word_ids)
+    assert lexicon.bucket('onbekende sleutel') == []
+
+    for word in checker.words:
+        suffix = checker.get_rhyme_suffix(word)
+        from_trie = [(checker.words[i], shared) for i, shared in checker.trie.matches(suffix)]
+        from_lexicon = [(lexicon.word(i), shared) for i, shared in lexicon.suffix_matches(suffix)]
+        assert sorted(from_lexicon) == sorted(from_trie)
+        # Longest shared ending first
+        depths = [shared for _, shared in from_lexicon]
+        assert depths == sorted(depths, reverse=True)
+    lexicon.close()
+
+def test_outdated_key_version_is_rejected(lexicon_path):
+    assert load_lexicon(lexicon_path, KEY_VERSION + 1) is None
+
+def test_truncated_lexicon_is_rejected(lexicon_path):
+    with open(lexicon_path, 'rb') as f:
+        data = f.read()
+    for length in (0, 20, len(data) // 2, len(data) - 4):
+        with open(lexicon_path, 'wb') as f:
+            f.write(data[:length])
+        assert load_lexicon(lexicon_path, KEY_VERSION) is None
+
+def test_missing_lexicon(tmp_path):
+    assert load_lexicon(str(tmp_path / 'bestaat-niet.bin'), KEY_VERSION) is None
@@ -0,0 +1,128 @@
+import email.utils
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+import pytest
+from poem_corpus import PoemCorpus
+from rate_limiter import parse_retry_after
+from sint_crawler import CRAWL_LEASE, SinterklaasCrawler
+from sint_scraper import SinterklaasGedichtenScraper
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+class PoemSite(ThreadingHTTPServer):
+    """Local stand-in for the poem site, with ETags and one 503 on page 2"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), PoemSiteHandler)
+        self.pages = {
+            '/gedichten': read_fixture('gedichten.html'),
+            '/gedichten/page/2': read_fixture('gedichten-page-2.html'),
+        }
+        self.unavailable = {'/gedichten/page/2'}
+        self.requests = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+class PoemSiteHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        site = self.server
+        site.requests.append((self.path, self.headers.get('If-None-Match')))
+        body = site.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path in site.unavailable:
+            site.unavailable.discard(self.path)
+            self.send_response(503)
+            self.send_header('Retry-After', email.utils.formatdate(time.time() - 1, usegmt=True))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def site():
+    site = PoemSite()
+    thread = threading.Thread(target=site.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield site
+    site.shutdown()
+    site.server_close()
+
+@pytest.fixture
+def corpus(tmp_path):
+    return PoemCorpus(str(tmp_path / 'corpus.sqlite3'))
+
+def make_crawler(site, corpus):
+    scraper = SinterklaasGedichtenScraper(corpus=corpus, base_url=site.url + '/gedichten')
+    return SinterklaasCrawler(scraper, workers=2, min_interval=0.0)
+
+def test_crawl_follows_links_on_the_same_site(site, corpus):
+    stats = make_crawler(site, corpus).crawl()
+
+    assert stats.fetched == 2
+    assert stats.failed == 0
+    assert stats.poems_added == 3
+    assert corpus.count() == 3
+    # Page 2 was retried after its 503, /contact and the other site are not followed
+    paths = [path for path, _ in site.requests]
+    assert paths.count('/gedichten/page/2') == 2
+    assert sorted(set(paths)) == ['/gedichten', '/gedichten/page/2']
+
+def test_crawl_again_uses_conditional_requests(site, corpus):
+    make_crawler(site, corpus).crawl()
+    site.requests.clear()
+
+    stats = make_crawler(site, corpus).crawl()
+
+    assert stats.not_modified == 2
+    assert stats.fetched == 0
+    assert all(etag for _, etag in site.requests)
+
+def test_crawl_skips_while_another_process_crawls(site, corpus, tmp_path):
+    other = PoemCorpus(corpus.path)
+    holder = other.acquire_lease(CRAWL_LEASE, 60)
+    assert holder is not None
+
+    assert make_crawler(site, corpus).crawl() is None
+    assert site.requests == []
+
+    other.release_lease(CRAWL_LEASE, holder)
+    assert make_crawler(site, corpus).crawl().fetched == 2
+
+def test_lease_expires(corpus):
+    assert corpus.acquire_lease('test', -1) is not None
+    assert corpus.acquire_lease('test', 60) is not None
+    assert corpus.acquire_lease('test', 60) is None
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('morgen') is None
+    assert parse_retry_after(email.utils.formatdate(time.time() - 60, usegmt=True)) == 0.0
+    assert 25 < parse_retry_after(email.utils.formatdate(time.time() + 30, usegmt=True)) <= 30
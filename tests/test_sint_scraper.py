@@ -0,0 +1,33 @@
+import os
+from poem_corpus import PoemCorpus
+from sint_scraper import SinterklaasGedichtenScraper, clean_poem, parse_poems
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+def test_parse_poems():
+    poems = parse_poems(read_fixture('gedichten.html'))
+    assert poems == [
+        "Sinterklaas zat te denken,\nwat hij Tim nu eens zou schenken.\n"
+        "Een bal, een boek of toch een fiets?\nZonder cadeau is het feest toch niets!",
+        "Piet kwam door de schoorsteen heen,\nmet een zak vol snoep voor iedereen.\n"
+        "Hij zette alles bij je schoen,\nwant dat hoort Piet nu eenmaal te doen.",
+    ]
+
+def test_parse_poems_without_poems():
+    assert parse_poems('<html><body><p>Geen gedichten hier</p></body></html>') == []
+
+def test_clean_poem():
+    assert clean_poem("  Regel <i>een</i>  \n\n\n  regel twee ") == "Regel een\nregel twee"
+
+def test_ingest_deduplicates(tmp_path):
+    corpus = PoemCorpus(str(tmp_path / 'corpus.sqlite3'))
+    scraper = SinterklaasGedichtenScraper(corpus=corpus, base_url='http://localhost/gedichten')
+    assert scraper.ingest(read_fixture('gedichten.html'), 'http://localhost/gedichten', etag='"v1"') == 2
+    # The first poem of page 2 is new, the second one is on page 1 as well
+    assert scraper.ingest(read_fixture('gedichten-page-2.html'), 'http://localhost/gedichten/page/2') == 1
+    assert corpus.count() == 3
+    assert corpus.page('http://localhost/gedichten')[0] == '"v1"'
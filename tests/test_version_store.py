@@ -0,0 +1,45 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import version_store
+from version_store import VersionStore
+
+THREADS = 8
+SAVES = 25
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_parallel_saves_get_unique_gap_free_versions(tmp_path, monkeypatch, returning):
+    # Without RETURNING the increment runs in a BEGIN IMMEDIATE transaction
+    monkeypatch.setattr(version_store, 'HAS_RETURNING', returning and version_store.HAS_RETURNING)
+    path = str(tmp_path / 'versies.sqlite3')
+    # One store per thread, like separate workers on one database
+    stores = [VersionStore(path) for _ in range(THREADS)]
+
+    def save(store):
+        return [store.next_version('Tim') for _ in range(SAVES)]
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        versions = [version for result in pool.map(save, stores) for version in result]
+
+    assert sorted(versions) == list(range(1, THREADS * SAVES + 1))
+    assert stores[0].current_version('Tim') == THREADS * SAVES
+    assert stores[0].next_version('Anna') == 1
+
+def test_legacy_json_counters_are_migrated_once(tmp_path):
+    path = str(tmp_path / 'versies.sqlite3')
+    legacy_path = tmp_path / 'poem_versions.json'
+    legacy_path.write_text(json.dumps({'Tim': 3, 'Anna': '7', 'Kapot': 'geen getal'}))
+
+    store = VersionStore(path, legacy_json_path=str(legacy_path))
+    assert store.current_version('Tim') == 3
+    assert store.current_version('Kapot') == 0
+    assert store.next_version('Anna') == 8
+
+    # user_version records the migration, a new store does not import again
+    legacy_path.write_text(json.dumps({'Tim': 10}))
+    store = VersionStore(path, legacy_json_path=str(legacy_path))
+    assert store.next_version('Tim') == 4
+
+def test_missing_legacy_json(tmp_path):
+    store = VersionStore(str(tmp_path / 'versies.sqlite3'), legacy_json_path=str(tmp_path / 'bestaat-niet.json'))
+    assert store.next_version('Tim') == 1
@@ -0,0 +1,51 @@
+"""
+Chain of cache tiers, fastest first
+
+A tier is anything with get(key), returning None on a miss, and
+set(key, value). A hit in a slower tier is copied to the faster ones. A
+tier that fails is skipped, so a read-only filesystem only loses the
+persistent tiers.
+"""
+
+class TieredCache:
+    """Look keys up tier by tier, store values in all tiers"""
+
+    def __init__(self, tiers, name='Cache'):
+        self.tiers = list(tiers)
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = tier.get(key)
+            except Exception as e:
+                print(f"{self.name} fout ({type(tier).__name__}): {str(e)}")
+                continue
+            if value is not None:
+                self.hits += 1
+                # Promote to the faster tiers
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            try:
+                tier.set(key, value)
+            except Exception as e:
+                print(f"{self.name} fout ({type(tier).__name__}): {str(e)}")
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value, or compute and store it"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,100 @@
+"""
+Version numbers of saved poems per name
+
+Every save takes the next version number for a name. The counters live
+in a SQLite table (WAL mode, so all workers on the machine share it)
+with the name as primary key, and one statement increments a counter
+and returns the new value. A save costs a single indexed write, and
+parallel workers never hand out the same number twice.
+
+The old poem_versions.json is imported the first time the store is
+opened.
+"""
+import json
+import os
+import sqlite3
+import threading
+from storage import ThreadConnections
+
+# RETURNING is supported from SQLite 3.35
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+class VersionStore:
+    """Atomic per-name version counters"""
+
+    def __init__(self, path, legacy_json_path=None):
+        self.path = path
+        self.legacy_json_path = legacy_json_path
+        # Autocommit mode, transactions are started explicitly
+        self.connections = ThreadConnections(path, self.create_table, isolation_level=None)
+        self.migrate_lock = threading.Lock()
+        self.migrated = False
+
+    def connect(self):
+        return self.connections.get()
+
+    def create_table(self, conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS poem_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )''')
+        self.migrate(conn)
+
+    def migrate(self, conn):
+        """Import poem_versions.json once, recorded in user_version"""
+        with self.migrate_lock:
+            if self.migrated:
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] < 1:
+                    versions = self.read_legacy_json()
+                    # Never lower a counter another worker already raised
+                    conn.executemany('''INSERT INTO poem_versions (name, version) VALUES (?, ?)
+                        ON CONFLICT(name) DO UPDATE SET version = MAX(version, excluded.version)''',
+                                     versions.items())
+                    conn.execute('PRAGMA user_version = 1')
+                    if versions:
+                        print(f"{len(versions)} versienummers overgenomen uit {self.legacy_json_path}")
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self.migrated = True
+
+    def read_legacy_json(self):
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return {}
+        try:
+            with open(self.legacy_json_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Kon {self.legacy_json_path} niet lezen: {str(e)}")
+            return {}
+        return {str(name): int(version) for name, version in data.items()
+                if isinstance(version, (int, float, str)) and str(version).isdigit()}
+
+    def next_version(self, name):
+        """Increment the counter of a name and return the new version"""
+        conn = self.connect()
+        upsert = '''INSERT INTO poem_versions (name, version) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET version = version + 1'''
+        if HAS_RETURNING:
+            return conn.execute(upsert + ' RETURNING version', (name,)).fetchone()[0]
+
+        # Older SQLite: the write lock of the transaction keeps the
+        # increment and the read together
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(upsert, (name,))
+            version = conn.execute('SELECT version FROM poem_versions WHERE name = ?', (name,)).fetchone()[0]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return version
+
+    def current_version(self, name):
+        """The last version handed out for a name, 0 if there is none"""
+        row = self.connect().execute('SELECT version FROM poem_versions WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0